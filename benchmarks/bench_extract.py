@@ -0,0 +1,161 @@
+"""Micro-benchmark: per-page extraction cost, old double-parse path vs compiled SiteExtractor,
+then corpus throughput with parsing on a thread pool vs the PARSE_IN_PROCESSES process pool,
+then the "format": "text"/"json" stream scanners on a synthetic list.
+
+Usage: python benchmarks/bench_extract.py [iterations] [corpus_pages] [stream_mb]
+
+Each file in benchmarks/fixtures/ is a saved listing page named after its SCRAPING_TARGETS key.
+"""
+import os
+import re
+import json
+import random
+import sys
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import proxy_scraper # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def legacy_parse(html_content, config):
+    """The pre-extractor code path: one soup for rows, a second soup for pagination, selectors re-evaluated."""
+    proxies = []
+    soup = BeautifulSoup(html_content, 'lxml')
+    for row in soup.select(config["ip_port_selector"]):
+        cells = row.find_all('td')
+        if len(cells) > max(config["ip_index"], config["port_index"]):
+            ip_text = cells[config["ip_index"]].get_text(strip=True)
+            port_text = cells[config["port_index"]].get_text(strip=True)
+            if re.match(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', ip_text) and re.match(r'\d+', port_text):
+                proxies.append(f"{ip_text}:{port_text}")
+    soup = BeautifulSoup(html_content, 'lxml')
+    next_href = None
+    if "pagination_selector" in config:
+        link = soup.select_one(config["pagination_selector"])
+        if link and link.has_attr('href'):
+            next_href = link['href']
+    return proxies, next_href
+
+def time_per_page(parse, html_content, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        parse(html_content)
+    return (time.perf_counter() - started) / iterations
+
+def load_fixtures():
+    """Returns [(site_name, raw page bytes)] for fixtures that match a configured site."""
+    pages = []
+    for file_name in sorted(os.listdir(FIXTURES_DIR)):
+        site_name = file_name.rsplit(".html", 1)[0]
+        if site_name in proxy_scraper.SCRAPING_TARGETS:
+            with open(os.path.join(FIXTURES_DIR, file_name), "rb") as f:
+                pages.append((site_name, f.read()))
+    return pages
+
+def corpus_throughput(corpus_pages):
+    """Parses the fixtures repeated to `corpus_pages` pages, on scraper-sized threads and on the parse process pool."""
+    fixtures = load_fixtures()
+    corpus = [fixtures[index % len(fixtures)] for index in range(corpus_pages)]
+    megabytes = sum(len(page) for _, page in corpus) / 1e6
+    targets = {site_name: proxy_scraper.SCRAPING_TARGETS[site_name] for site_name, _ in fixtures}
+    extractors = proxy_scraper.compile_site_extractors(targets)
+    processes = proxy_scraper.PARSE_PROCESSES or os.cpu_count()
+    print(f"\ncorpus: {corpus_pages} pages, {megabytes:.1f} MB, {os.cpu_count()} CPU cores")
+    print(f"{'engine':<28}{'pages/s':>10}{'MB/s':>8}{'wall s':>9}")
+
+    def report(engine, wall):
+        print(f"{engine:<28}{corpus_pages / wall:>10.1f}{megabytes / wall:>8.2f}{wall:>9.2f}")
+
+    with ThreadPoolExecutor(max_workers=proxy_scraper.SCRAPING_CONCURRENCY) as executor:
+        started = time.perf_counter()
+        thread_results = list(executor.map(lambda item: extractors[item[0]].parse(item[1]), corpus))
+        report(f"threads ({proxy_scraper.SCRAPING_CONCURRENCY})", time.perf_counter() - started)
+
+    pool = proxy_scraper.start_parse_pool(targets, processes)
+    try:
+        list(pool.map(proxy_scraper.parse_in_worker, *zip(*fixtures * processes))) # Start and warm every worker
+        started = time.perf_counter()
+        process_results = list(pool.map(proxy_scraper.parse_in_worker, *zip(*corpus), chunksize=4))
+        report(f"processes ({processes})", time.perf_counter() - started)
+    finally:
+        pool.shutdown()
+    if process_results != thread_results:
+        print("process pool output differs from in-thread parse!")
+        sys.exit(1)
+
+def stream_throughput(megabytes):
+    """Feeds a ~`megabytes` MB text list and JSON document through the stream scanners in STREAM_CHUNK_SIZE chunks."""
+    rng = random.Random(1)
+    proxies = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}:{rng.randint(1, 65535)}"
+               for _ in range(int(megabytes * 1e6 / 22))]
+    documents = [
+        ("text", proxy_scraper.TextListScanner, ("\n".join(proxies) + "\n").encode()),
+        ("json", proxy_scraper.JsonRecordScanner,
+         json.dumps({"data": [{"ip": proxy.split(":")[0], "port": proxy.split(":")[1]} for proxy in proxies]}).encode()),
+    ]
+    chunk_size = proxy_scraper.STREAM_CHUNK_SIZE
+    print(f"\nstream scanners: {len(proxies)} proxies, {chunk_size // 1024} KiB chunks")
+    print(f"{'format':<28}{'MB':>8}{'MB/s':>8}{'peak KiB':>10}")
+    for name, scanner_class, document in documents:
+        def scan():
+            scanner = scanner_class()
+            found = []
+            for offset in range(0, len(document), chunk_size):
+                found += scanner.feed(document[offset:offset + chunk_size])
+            return found + scanner.close()
+        started = time.perf_counter()
+        if scan() != proxies:
+            print(f"{name} scanner output differs from the generated list!")
+            sys.exit(1)
+        wall = time.perf_counter() - started
+
+        def scan_and_drop(): # Like the pipeline: candidates leave in batches, so only the scanner's state stays alive
+            scanner = scanner_class()
+            for offset in range(0, len(document), chunk_size):
+                scanner.feed(document[offset:offset + chunk_size])
+        tracemalloc.start()
+        scan_and_drop()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:<28}{len(document) / 1e6:>8.1f}{len(document) / 1e6 / wall:>8.1f}{peak // 1024:>10}")
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    corpus_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    stream_mb = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+    warnings.simplefilter("ignore", FutureWarning) # soupsieve's ':contains' deprecation notice
+    print(f"{'fixture':<28}{'rows':>6}{'legacy ms':>12}{'compiled ms':>13}{'speedup':>9}  path")
+    total_legacy = total_compiled = 0.0
+    for file_name in sorted(os.listdir(FIXTURES_DIR)):
+        site_name = file_name.rsplit(".html", 1)[0]
+        config = proxy_scraper.SCRAPING_TARGETS.get(site_name)
+        if config is None:
+            continue
+        with open(os.path.join(FIXTURES_DIR, file_name), encoding="utf-8") as f:
+            html_content = f.read()
+        extractor = proxy_scraper.SiteExtractor(site_name, config)
+        expected = legacy_parse(html_content, config)
+        if extractor.parse(html_content) != expected:
+            print(f"{site_name}: compiled extractor output differs from legacy parse!")
+            sys.exit(1)
+        legacy = time_per_page(lambda html: legacy_parse(html, config), html_content, iterations)
+        compiled = time_per_page(extractor.parse, html_content, iterations)
+        total_legacy += legacy
+        total_compiled += compiled
+        print(f"{site_name:<28}{len(expected[0]):>6}{legacy * 1000:>12.2f}{compiled * 1000:>13.2f}"
+              f"{legacy / compiled:>8.1f}x  {'lxml' if extractor.use_lxml else 'soupsieve'}")
+    if total_compiled:
+        print(f"{'all fixtures':<34}{total_legacy * 1000:>12.2f}{total_compiled * 1000:>13.2f}{total_legacy / total_compiled:>8.1f}x")
+    if corpus_pages:
+        corpus_throughput(corpus_pages)
+    if stream_mb:
+        stream_throughput(stream_mb)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+"""Offline throughput benchmark: scrape, prefilter, probe, DNSBL and full pipeline against local stand-ins.
+
+Everything runs on loopback, no internet needed:
+  - fake HTTP proxies (one per 127.0.x.y address) with configurable latency, drop rate and blackholing
+  - fake listing sites that render the SCRAPING_TARGETS table/pagination layouts (offset and 'next'-link)
+  - a stub DNSBL server answering for FREE_DNSBL_SERVERS zones
+
+Usage:
+  python benchmarks/bench_offline.py --proxies 500 --dead 1500 --blackholed 50 --json run.json
+  python benchmarks/bench_offline.py --engine async --compare run.json
+
+Each stage reports items/sec, p50/p95/p99 latency (probe and DNSBL stages), peak RSS and wall time.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import warnings
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import proxy_scraper # noqa: E402
+
+# --- Local stand-ins ---
+
+def loopback_address(index, block):
+    """Distinct 127.x.y.z address per index, so per-IP logic (DNSBL cache, host buckets) sees distinct hosts."""
+    return f"127.{block}.{index // 250}.{index % 250 + 1}"
+
+class FakeProxyFleet:
+    """HTTP proxies on an asyncio loop in a background thread; answer every GET with 200 after a delay."""
+
+    def __init__(self, count, blackholed, latency_ms, jitter_ms, drop_rate, seed):
+        self.count = count
+        self.blackholed = blackholed
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.working = [] # ip:port of proxies that answer
+        self.blackholes = [] # ip:port of proxies that accept and never answer
+        self.loop = asyncio.new_event_loop()
+        self.servers = []
+
+    async def handle_working(self, reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            await asyncio.sleep(max(0, self.random.gauss(self.latency, self.jitter)))
+            if self.random.random() >= self.drop_rate:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_blackhole(self, reader, writer):
+        try:
+            while await reader.read(4096): # Swallow everything until the client gives up
+                pass
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def start_servers(self):
+        for index in range(self.count + self.blackholed):
+            host = loopback_address(index, 10)
+            blackhole = index >= self.count
+            server = await asyncio.start_server(self.handle_blackhole if blackhole else self.handle_working, host, 0)
+            self.servers.append(server)
+            (self.blackholes if blackhole else self.working).append(f"{host}:{server.sockets[0].getsockname()[1]}")
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start_servers())
+            ready.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+        return self
+
+def dead_candidates(count):
+    """ip:port pairs on loopback where nothing listens, so connect() is refused."""
+    candidates = []
+    for index in range(count):
+        host = loopback_address(index, 20)
+        probe = socket.socket()
+        probe.bind((host, 0))
+        candidates.append(f"{host}:{probe.getsockname()[1]}")
+        probe.close()
+    return candidates
+
+def split_selector(selector):
+    """Splits a descendant-chain selector into its compound steps (quoted values may contain spaces)."""
+    steps, current = [], []
+    for match in proxy_scraper.CSS_TOKEN_PATTERN.finditer(selector.strip()):
+        if match.group("space"):
+            steps.append(current)
+            current = []
+        else:
+            current.append(match)
+    return steps + [current]
+
+def selector_to_html(steps, inner, href=None):
+    """Renders descendant-chain selector steps (tag#id.class[attr='v']:contains('t')) as nested HTML."""
+    opening, closing = [], []
+    for compound in steps:
+        tag, attributes, text = "div", {}, None
+        for match in compound:
+            if match.group("tag"):
+                tag = match.group("tag") if match.group("tag") != "*" else "div"
+            elif match.group("id"):
+                attributes["id"] = match.group("id")
+            elif match.group("cls"):
+                attributes["class"] = (attributes.get("class", "") + " " + match.group("cls")).strip()
+            elif match.group("attr"):
+                attributes[match.group("attr")] = match.group("value") or ""
+            elif match.group("text_quote"):
+                text = match.group("text")
+        if tag == "a" and href is not None:
+            attributes["href"] = href
+        rendered = "".join(f' {name}="{value}"' for name, value in attributes.items())
+        opening.append(f"<{tag}{rendered}>" + (text or ""))
+        closing.insert(0, f"</{tag}>")
+    return "".join(opening) + inner + "".join(closing)
+
+def render_listing_page(config, rows, next_href):
+    """One listing page laid out the way the site's selectors expect it."""
+    cell_count = max(config["ip_index"], config["port_index"]) + 3
+    body = []
+    for proxy in rows:
+        ip, port = proxy.rsplit(":", 1)
+        cells = ["<td>HTTP</td>"] * cell_count
+        cells[config["ip_index"]] = f"<td>{ip}</td>"
+        cells[config["port_index"]] = f"<td>{port}</td>"
+        body.append("".join(cells))
+    # The row selector's last step is the row itself, everything before it wraps the rows
+    *wrappers, row_step = split_selector(config["ip_port_selector"])
+    row_html = "".join(selector_to_html([row_step], cells) for cells in body)
+    table = selector_to_html(wrappers, row_html) if wrappers else row_html
+    pagination = ""
+    if next_href and config.get("pagination_selector"):
+        pagination = selector_to_html(split_selector(config["pagination_selector"]), "", href=next_href)
+    return f"<!DOCTYPE html><html><head><title>Proxy list</title></head><body><nav>menu</nav>{table}{pagination}</body></html>"
+
+class FakeListingSite(BaseHTTPRequestHandler):
+    """Serves server.pages (list of row lists) using offset (?start=) or ?page= pagination."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        config = server.config
+        if config.get("pagination_type") == "offset":
+            page_index = int(query.get(config["offset_param"], ["0"])[0]) // config.get("offset_step", 64)
+        else:
+            page_index = int(query.get("page", ["1"])[0]) - 1
+        rows = server.pages[page_index] if 0 <= page_index < len(server.pages) else []
+        next_href = f"?page={page_index + 2}" if page_index + 1 < len(server.pages) else None
+        time.sleep(server.page_latency)
+        body = render_listing_page(config, rows, next_href).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_listing_sites(candidates, site_count, pages, rows_per_page, duplicate_rate, page_latency_ms, seed):
+    """Spreads candidates over fake copies of the first `site_count` SCRAPING_TARGETS; returns local targets."""
+    rnd = random.Random(seed)
+    candidates = list(candidates)
+    rnd.shuffle(candidates)
+    names = list(proxy_scraper.SCRAPING_TARGETS)[:site_count]
+    targets = {}
+    position = 0
+    for site_index, name in enumerate(names):
+        config = dict(proxy_scraper.SCRAPING_TARGETS[name])
+        site_pages = []
+        for _ in range(min(pages, config.get("max_pages_to_scrape", proxy_scraper.MAX_SCRAPING_PAGES))):
+            rows = []
+            for _ in range(rows_per_page):
+                if candidates and (position >= len(candidates) or rnd.random() < duplicate_rate):
+                    rows.append(rnd.choice(candidates)) # Same proxy listed on several sites
+                elif position < len(candidates):
+                    rows.append(candidates[position])
+                    position += 1
+            site_pages.append(rows)
+        server = ThreadingHTTPServer((loopback_address(site_index, 30), 0), FakeListingSite)
+        server.daemon_threads = True
+        server.config = config
+        server.pages = site_pages
+        server.page_latency = page_latency_ms / 1000
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        config["base_url"] = f"http://{host}:{port}/list/"
+        targets[name] = config
+    return targets
+
+class StubDnsbl(asyncio.DatagramProtocol):
+    """Answers A queries for <reversed-ip>.<zone>: 127.0.0.2 for a deterministic share of IPs, else NXDOMAIN."""
+
+    def __init__(self, listed_rate, latency_ms):
+        self.listed_rate = listed_rate
+        self.latency = latency_ms / 1000
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        offset, labels = 12, []
+        while data[offset]:
+            length = data[offset]
+            labels.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+            offset += length + 1
+        question = data[12:offset + 5]
+        ip = ".".join(labels[:4][::-1])
+        query_id = struct.unpack_from("!H", data)[0]
+        if zlib.crc32(ip.encode()) % 10000 < self.listed_rate * 10000:
+            response = (struct.pack("!HHHHHH", query_id, 0x8180, 1, 1, 0, 0) + question
+                        + b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, 300, 4) + bytes([127, 0, 0, 2]))
+        else:
+            soa = b"\x02ns\xc0\x0c\x05admin\xc0\x0c" + struct.pack("!IIIII", 1, 3600, 600, 86400, 300)
+            response = (struct.pack("!HHHHHH", query_id, 0x8183, 1, 0, 1, 0) + question
+                        + b"\xc0\x0c" + struct.pack("!HHIH", 6, 1, 300, len(soa)) + soa)
+        asyncio.get_running_loop().call_later(self.latency, self.transport.sendto, response, addr)
+
+def start_stub_dnsbl(loop, listed_rate, latency_ms):
+    future = asyncio.run_coroutine_threadsafe(
+        loop.create_datagram_endpoint(lambda: StubDnsbl(listed_rate, latency_ms), local_addr=("127.0.0.53", 0)), loop)
+    transport, _ = future.result()
+    return transport.get_extra_info("sockname")
+
+# --- Measurement ---
+
+class RssSampler:
+    """Samples resident memory in the background; .peak_mb is the highest value seen inside the block."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_kb = 0
+        self.stop = threading.Event()
+
+    @staticmethod
+    def current_kb():
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # Lifetime peak where /proc is missing
+
+    def sample(self):
+        while not self.stop.wait(self.interval):
+            self.peak_kb = max(self.peak_kb, self.current_kb())
+
+    def __enter__(self):
+        self.peak_kb = self.current_kb()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        self.peak_kb = max(self.peak_kb, self.current_kb())
+
+    @property
+    def peak_mb(self):
+        return round(self.peak_kb / 1024, 1)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def stage_record(items, wall, rss, latencies=None, **extra):
+    record = {"items": items, "wall_s": round(wall, 3), "items_per_s": round(items / wall, 1) if wall else None,
+              "peak_rss_mb": rss.peak_mb}
+    if latencies is not None:
+        latencies = sorted(latencies)
+        for name, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            value = percentile(latencies, fraction)
+            record[name] = round(value * 1000, 1) if value is not None else None
+    record.update(extra)
+    return record
+
+def bench_scrape(targets):
+    proxy_scraper.compile_site_extractors(targets)
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        results = proxy_scraper.scrape_all_sites(targets)
+        wall = time.perf_counter() - started
+    candidates = [proxy for proxies in results.values() for proxy in proxies]
+    return stage_record(len(candidates), wall, rss, sites=len(results)), candidates
+
+def bench_prefilter(candidates):
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        reachable = proxy_scraper.tcp_prefilter(candidates)
+        wall = time.perf_counter() - started
+    return stage_record(len(candidates), wall, rss, reachable=len(reachable)), reachable
+
+def bench_probe(candidates, engine):
+    latencies = []
+    working = []
+
+    def timed_probe(proxy):
+        started = time.perf_counter()
+        ok = proxy_scraper.test_proxy(proxy)[0]
+        return proxy, ok, time.perf_counter() - started
+
+    async def timed_async_probes():
+        semaphore = asyncio.Semaphore(proxy_scraper.ASYNC_MAX_CONCURRENCY)
+
+        async def probe(proxy):
+            async with semaphore:
+                started = time.perf_counter()
+                ok = (await proxy_scraper.async_test_proxy(proxy))[0]
+                return proxy, ok, time.perf_counter() - started
+
+        return await asyncio.gather(*(probe(proxy) for proxy in candidates))
+
+    proxy_scraper.run_metrics = proxy_scraper.RunMetrics() # Fresh counters, the timeouts come from this stage only
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        if engine == "async":
+            results = asyncio.run(timed_async_probes())
+        else:
+            with ThreadPoolExecutor(max_workers=proxy_scraper.MAX_WORKERS) as executor:
+                results = list(executor.map(timed_probe, candidates))
+        wall = time.perf_counter() - started
+    for proxy, ok, latency in results:
+        latencies.append(latency)
+        if ok:
+            working.append(proxy)
+    # Counted by the probes themselves: they time out at the learned deadline, well under TIMEOUT
+    timeouts = proxy_scraper.run_metrics.stages.get("http-probe", {}).get("timeouts", 0)
+    return stage_record(len(candidates), wall, rss, latencies, working=len(working), timeouts=timeouts), working
+
+def bench_dnsbl(proxies):
+    ips = sorted({proxy.rsplit(":", 1)[0] for proxy in proxies})
+    latencies = []
+
+    def timed_check(ip):
+        started = time.perf_counter()
+        listings = proxy_scraper.check_dnsbl(ip)
+        latencies.append(time.perf_counter() - started)
+        return listings
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            listed = sum(1 for listings in executor.map(timed_check, ips) if listings)
+        wall = time.perf_counter() - started
+    return stage_record(len(ips), wall, rss, latencies, listed=listed)
+
+def bench_pipeline(targets, work_dir):
+    proxy_scraper.health_store = proxy_scraper.ProxyHealthStore(os.path.join(work_dir, "health.db"))
+    proxy_scraper.OUTPUT_JSON_FILE = os.path.join(work_dir, "working.json")
+    proxy_scraper.OUTPUT_CSV_FILE = os.path.join(work_dir, "working.csv")
+    pipeline = proxy_scraper.ProxyPipeline(targets, output_file=os.path.join(work_dir, "working.txt"))
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        working = asyncio.run(pipeline.run())
+        wall = time.perf_counter() - started
+    proxy_scraper.health_store.connection.close()
+    proxy_scraper.health_store = None
+    return stage_record(len(pipeline.seen), wall, rss, working=len(working))
+
+# --- Reporting ---
+
+def print_report(report, baseline=None):
+    columns = ["items", "items_per_s", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "wall_s"]
+    print(f"\n{'stage':<12}" + "".join(f"{column:>14}" for column in columns) + "  extra")
+    for stage, record in report["stages"].items():
+        cells = "".join(f"{'-' if record.get(column) is None else record[column]:>14}" for column in columns)
+        extra = ", ".join(f"{key}={value}" for key, value in record.items() if key not in columns)
+        print(f"{stage:<12}{cells}  {extra}")
+        if baseline and stage in baseline.get("stages", {}):
+            before = baseline["stages"][stage]
+            deltas = []
+            for column in ("items_per_s", "p95_ms", "peak_rss_mb", "wall_s"):
+                if before.get(column) and record.get(column) is not None:
+                    deltas.append(f"{column} {(record[column] - before[column]) / before[column] * 100:+.1f}%")
+            print(f"{'':<12}vs baseline: {', '.join(deltas)}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proxies", type=int, default=300, help="working fake proxies")
+    parser.add_argument("--blackholed", type=int, default=30, help="proxies that accept but never answer")
+    parser.add_argument("--dead", type=int, default=1000, help="candidates whose port refuses connections")
+    parser.add_argument("--latency-ms", type=float, default=150, help="mean fake proxy response latency")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="stddev of fake proxy latency")
+    parser.add_argument("--drop-rate", type=float, default=0.1, help="share of requests a working proxy drops")
+    parser.add_argument("--listed-rate", type=float, default=0.05, help="share of IPs the stub DNSBL lists")
+    parser.add_argument("--dns-latency-ms", type=float, default=20)
+    parser.add_argument("--sites", type=int, default=8, help="fake listing sites (copies of SCRAPING_TARGETS layouts)")
+    parser.add_argument("--pages", type=int, default=5, help="pages per site")
+    parser.add_argument("--rows-per-page", type=int, default=64)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2, help="share of rows repeating another row")
+    parser.add_argument("--page-latency-ms", type=float, default=100)
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--timeout", type=float, default=3, help="overrides TIMEOUT (blackholes cost this much)")
+    parser.add_argument("--workers", type=int, default=proxy_scraper.MAX_WORKERS, help="overrides MAX_WORKERS")
+    parser.add_argument("--scraping-concurrency", type=int, default=proxy_scraper.SCRAPING_CONCURRENCY)
+    parser.add_argument("--scraping-delay", type=float, default=0.05, help="overrides SCRAPING_DELAY per fake host")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="baseline report (from --json) to print deltas against")
+    parser.add_argument("--verbose", action="store_true", help="show proxy_scraper's own progress output")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    warnings.simplefilter("ignore")
+    proxy_scraper.raise_open_file_limit(args.proxies + args.blackholed + args.dead + 2000)
+
+    fleet = FakeProxyFleet(args.proxies, args.blackholed, args.latency_ms, args.jitter_ms, args.drop_rate, args.seed).start()
+    candidates = fleet.working + fleet.blackholes + dead_candidates(args.dead)
+    targets = start_listing_sites(candidates, args.sites, args.pages, args.rows_per_page, args.duplicate_rate,
+                                  args.page_latency_ms, args.seed)
+    nameserver = start_stub_dnsbl(fleet.loop, args.listed_rate, args.dns_latency_ms)
+
+    proxy_scraper.REJECT_RESERVED_ADDRESSES = False # Every stand-in lives on 127.0.0.0/8
+    proxy_scraper.PROXY_TEST_URL = "http://bench.invalid/"
+    proxy_scraper.TIMEOUT = args.timeout
+    proxy_scraper.MAX_WORKERS = args.workers
+    proxy_scraper.SCRAPING_CONCURRENCY = args.scraping_concurrency
+    proxy_scraper.SCRAPING_DELAY = args.scraping_delay
+    proxy_scraper.RETRY_DELAY = 0.2
+    proxy_scraper.USE_ASYNC_VALIDATION = args.engine == "async"
+
+    report = {"config": vars(args), "stages": {}}
+    work_dir = tempfile.mkdtemp(prefix="bench_offline_")
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            proxy_scraper.dnsbl_resolver = proxy_scraper.DnsblResolver(nameserver=nameserver)
+            report["stages"]["scrape"], scraped = bench_scrape(targets)
+            unique = list(proxy_scraper.CandidateSet(scraped))
+            report["stages"]["prefilter"], reachable = bench_prefilter(unique)
+            proxy_scraper.probe_timeout = proxy_scraper.AdaptiveTimeout()
+            report["stages"]["probe"], working = bench_probe(reachable, args.engine)
+            report["stages"]["dnsbl"] = bench_dnsbl(working)
+            # Fresh DNSBL cache so the end-to-end run pays for its own lookups
+            proxy_scraper.dnsbl_resolver = proxy_scraper.DnsblResolver(nameserver=nameserver)
+            # Likewise an untrained probe timeout, the probe stage above would have tuned it already
+            proxy_scraper.probe_timeout = proxy_scraper.AdaptiveTimeout()
+            report["stages"]["pipeline"] = bench_pipeline(targets, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(f"{len(candidates)} candidates ({args.proxies} working, {args.blackholed} blackholed, {args.dead} dead), "
+          f"{args.sites} sites x {args.pages} pages, engine={args.engine}")
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,40 @@
 import requests
 from bs4 import BeautifulSoup
+import soupsieve
+import lxml.html
+from lxml import etree
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import warnings
 import os
 import time
 import random
 import socket
+import struct
+import json
+import threading
+import sqlite3
+import selectors
+import errno
+import bisect
+import heapq
+import argparse
+import zlib
+import subprocess
+import sys
+import csv
+import statistics
+import codecs
+import hashlib
+from array import array
+from collections import deque, OrderedDict
+import ssl
+import asyncio
+import cProfile
+import pstats
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urljoin, urlparse, parse_qs, urlencode # Updated for parsing URLs
 
 # --- Configuration ---
@@ -13,11 +42,69 @@ PROXY_TEST_URL = "http://www.google.com" # Proxy test ke liye URL
 TIMEOUT = 20 # Request timeout in seconds (bad proxies ke liye zyada wait na kare)
 MAX_WORKERS = 150 # Proxy testing ke liye concurrent workers
 OUTPUT_FILE = "working_proxies.txt" # Valid proxies save karne ki file
-SCRAPING_CONCURRENCY = 3 # Ek saath kitni websites scrape honge (avoid overwhelming sites)
-SCRAPING_DELAY = 3 # Har page request ke beech mein delay (per site)
+OUTPUT_JSON_FILE = "working_proxies.json" # Score ke hisaab se sorted list, latency/protocol/last_checked ke saath
+OUTPUT_CSV_FILE = "working_proxies.csv" # Wahi ranked list CSV mein
+PROBES_PER_PROXY = 3 # Har proxy par kitne probes (connect time + time-to-first-byte) chalenge
+PROBE_MIN_SUCCESS_RATIO = 0.5 # Itne probes pass hone par hi proxy working mana jayega
+PROBE_PROTOCOL_ORDER = ("http", "socks4", "socks5") # Site/history se protocol hint na ho to is order mein handshakes
+# (SOCKS4 pehle: SOCKS5 servers v4 request par turant band ho jaate hain, jabki kuch SOCKS4 servers v5 greeting par chup rehte hain)
+PROBE_SNIFF_TIMEOUT = 3 # SOCKS greeting ka jawab itne seconds mein na aaye to agla protocol try karo
+ADAPTIVE_TIMEOUT = True # Probe timeout successful probes ki latency se seekha jayega (TIMEOUT sirf upper limit)
+ADAPTIVE_TIMEOUT_PERCENTILE = 95 # Successful probe latencies ka ye percentile...
+ADAPTIVE_TIMEOUT_MARGIN = 2 # ...plus itne seconds = probe timeout
+ADAPTIVE_TIMEOUT_FLOOR = 3 # Seekha hua timeout isse kam nahi hoga
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 20 # Itne successful probes se pehle TIMEOUT hi use hoga
+ADAPTIVE_TIMEOUT_WINDOW = 1000 # Sirf itne latest successful probes se percentile nikalega
+TARGET_WORKING_PROXIES = 0 # Itne working + clean proxies milte hi baaki kaam cancel (0 = sab test karo)
+DAEMON_HOST = "127.0.0.1" # --daemon mode mein local API is address par
+DAEMON_PORT = 8899 # ...aur is port par sunegi
+DAEMON_RESCRAPE_INTERVAL = 30 * 60 # Daemon har itne seconds baad saari sites dobara scrape karega
+DAEMON_REVALIDATE_INTERVAL = 10 * 60 # Pool ka har proxy itne seconds baad dobara probe hoga
+DAEMON_REVALIDATE_WORKERS = 20 # Pool revalidation ke liye threads
+DAEMON_MAX_COUNT = 500 # /proxies?count= ek request mein isse zyada proxies nahi dega
+COORDINATOR_HOST = "127.0.0.1" # --coordinator mode mein workers is address par connect karenge
+COORDINATOR_PORT = 8898 # ...aur is port par
+SHARD_COUNT = 64 # Dedup ke baad candidates kitne shards mein bantenge
+SHARD_LEASE_SECONDS = 120 # Worker se itni der heartbeat na aaye to uska shard kisi aur ko milega
+SCRAPING_CONCURRENCY = 8 # Saari sites mila kar ek saath kitni page requests in flight (per-site limit SCRAPING_DELAY se)
+SCRAPING_DELAY = 3 # Har host par requests ke beech ka average gap (token bucket rate = 1/SCRAPING_DELAY)
+SCRAPING_BURST = 2 # Ek host par bina wait kiye kitni requests ek saath ja sakti hain
+PARSE_IN_PROCESSES = False # True par HTML parsing alag processes mein hogi (GIL se bahar), fetch threads sirf I/O karenge
+PARSE_PROCESSES = None # Parse processes ki ginti; None = CPU cores jitne
+STREAM_CHUNK_SIZE = 64 * 1024 # "format": "text"/"json" sources ka response itne bytes ke chunks mein padha jayega
+STREAM_BATCH_SIZE = 1000 # Stream sources se itne candidates jama hote hi dedup ko bhej diye jayenge
+USE_PAGE_CACHE = True # Pages ke ETag/Last-Modified/hash yaad rakho; page na badla ho to purane candidates reuse, parsing skip
+PAGE_CACHE_FILE = "page_cache.db" # Page cache (SQLite), runs ke beech save hota hai
+PAGE_CACHE_RETENTION = 7 * 24 * 3600 # Itne din se check nahi hua URL cache se hata diya jayega
+PAGE_CACHE_MAX_CANDIDATES = 100000 # Isse badi stream lists cache nahi hongi (replay ke liye poori list memory mein aati hai, 8 bytes/candidate)
 MAX_SCRAPING_PAGES = 7 # Har site से kitne pages scrape karne hain (avoid infinite loops, increase from 5)
 RETRY_ATTEMPTS = 3 # Kitni baar request retry kare (403 ya connection errors ke liye)
 RETRY_DELAY = 5 # Retry ke beech mein kitna wait kare
+SOURCE_STATS_FILE = "source_stats.json" # Har site ki yield history (fetch success, candidates/working per page), runs ke beech save hoti hai
+SOURCE_ADAPTIVE_BUDGETS = True # True par yield history se har site ke pages, retries aur scrape order tay honge
+SOURCE_STATS_DECAY = 0.7 # Har run ke baad purane counters ka itna hissa bachta hai (naye runs zyada matter karte hain)
+SOURCE_STATS_MIN_RUNS = 2 # Itne runs ki history se pehle site ko configured budget hi milega
+SOURCE_MAX_PAGES = 2 * MAX_SCRAPING_PAGES # High-yield site ko isse zyada pages nahi milenge
+SOURCE_BLOCKED_RATIO = 0.2 # Isse kam fetch success rate waali site (403/JS) par retries nahi honge
+SOURCE_BARREN_RUNS = 3 # Itne lagataar runs mein ek bhi working proxy na mile to site probation par
+SOURCE_REPROBE_EVERY = 4 # Probation waali site har itne runs mein ek baar 1 page, 1 attempt se check hogi
+USE_ASYNC_VALIDATION = False # True karne par ThreadPoolExecutor ki jagah asyncio engine proxies test karega
+ASYNC_MAX_CONCURRENCY = 2000 # Async engine mein ek saath kitne probes in flight ho sakte hain
+USE_TCP_PREFILTER = True # Full HTTP probe se pehle sasta TCP connect() check, dead ports turant hata deta hai
+TCP_PREFILTER_TIMEOUT = 4 # TCP connect ke liye max wait (seconds), HTTP TIMEOUT se kaafi kam
+TCP_PREFILTER_BATCH = 1000 # Prefilter mein ek saath kitne non-blocking connect() in flight
+REJECT_RESERVED_ADDRESSES = True # Private/reserved IPs (10.x, 127.x, 192.168.x ...) candidates mein accept na kare
+PIPELINE_QUEUE_SIZE = 5000 # Har pipeline stage ke beech queue ka max size (memory isi se bounded hai)
+TCP_PREFILTER_PARALLEL_BATCHES = 2 # Pipeline mein ek saath kitne prefilter batches chal sakte hain
+PREFILTER_BATCH_WAIT = 0.5 # Pehle candidate ke baad batch bharne ke liye max wait (seconds)
+METRICS_JSON_FILE = "run_metrics.json" # Run ke end par per-site/per-stage metrics ka JSON summary
+METRICS_PROM_FILE = "run_metrics.prom" # Wahi metrics Prometheus text format mein
+PROFILE_STAGES = os.environ.get("PROXY_SCRAPER_PROFILE") == "1" # True par har stage cProfile se wrap hoga
+PROFILE_DIR = "profiles" # Per-stage .prof files yahan save hongi
+HEALTH_DB_FILE = "proxy_health.db" # Har proxy ki history (SQLite), runs ke beech save hoti hai
+HEALTH_BACKOFF_BASE = 5 * 3600 # Pehli failure ke baad itne seconds baad retest; har failure par double
+HEALTH_BACKOFF_MAX = 7 * 24 * 3600 # Backoff isse zyada nahi badhega
+HEALTH_RETENTION = 14 * 24 * 3600 # Itne din se scrape nahi hua proxy DB se hata diya jayega
 # --- End Configuration ---
 
 # Free/Public DNSBL servers for basic blacklist check
@@ -27,6 +114,14 @@ FREE_DNSBL_SERVERS = [
     "dnsbl.sorbs.net",
     "b.barracudacentral.org"
 ]
+DNSBL_NAMESERVER = None # DNSBL queries ke liye (ip, port); None = /etc/resolv.conf ka pehla nameserver
+DNSBL_QUERY_TIMEOUT = 3 # Saare zones ke answers ke liye max wait (seconds)
+DNSBL_MAX_INFLIGHT = 64 # Ek saath kitne IPs ke DNSBL lookups chal sakte hain
+DNSBL_CACHE_FILE = "dnsbl_cache.json" # DNSBL results runs ke beech yahan save hote hain
+DNSBL_CACHE_MAX_ENTRIES = 50000 # Cache mein max IPs, uske baad expired/purane entries hatenge
+DNSBL_DEFAULT_TTL = 3600 # Jab DNS answer mein TTL na mile
+DNSBL_MIN_CACHE_TTL = 13 * 3600 # Cron har 12 ghante chalta hai, isliye entry kam se kam agle run tak valid rahe
+DNSBL_MAX_CACHE_TTL = 3 * 24 * 3600 # Isse purana listing status dobara check hoga
 
 # Random User-Agents to mimic different browsers and avoid detection
 USER_AGENTS = [
@@ -43,6 +138,10 @@ USER_AGENTS = [
 # --- Websites to Scrape ---
 # Har entry mein 'base_url', 'ip_port_selector', 'ip_index', 'port_index' zaroori hain.
 # 'pagination_selector' ya 'pagination_type' pagination ke liye hain.
+# Optional 'protocol' ("http", "https", "socks4", "socks5" ya "socks") batata hai ki probe pehle kaunsa handshake try kare.
+# Optional 'max_pages_to_scrape' / 'retry_attempts' site ka budget set karte hain; SOURCE_ADAPTIVE_BUDGETS inhe history se badalta hai.
+# "format": "text" (raw ip:port list) ya "json" (records ka array) waali sites ko sirf 'base_url' chahiye; unka
+# response stream hota hai, DOM nahi banta. JSON records ke keys 'json_ip_key' / 'json_port_key' se (default "ip"/"port").
 # Agar koi site JS se content load karti hai, toh yeh code uske liye kaam nahi karega.
 # Selectors ko latest check ke hisaab se update kiya gaya hai, phir bhi manual verification zaroori hai.
 SCRAPING_TARGETS = {
@@ -90,6 +189,7 @@ SCRAPING_TARGETS = {
         "ip_port_selector": "table#proxylisttable tbody tr",
         "ip_index": 0,
         "port_index": 1,
+        "protocol": "socks", # SOCKS4 aur SOCKS5 dono mile hue
         "pagination_selector": "div#list div.btn-group a.paginate.btn:contains('Next')",
     },
     # New Sites (selectors adjusted based on common patterns, may need manual fine-tuning)
@@ -105,6 +205,7 @@ SCRAPING_TARGETS = {
         "ip_port_selector": "table.table.table-striped tbody tr",
         "ip_index": 0,
         "port_index": 1,
+        "protocol": "https",
         "pagination_selector": "ul.pagination li a:contains('>')",
     },
     "proxybros.com": {
@@ -154,6 +255,7 @@ SCRAPING_TARGETS = {
         "ip_port_selector": "table.table-striped tbody tr",
         "ip_index": 0,
         "port_index": 1,
+        "protocol": "socks5",
         "pagination_selector": "ul.pagination li a:contains('Next')",
     },
     "proxycompass.com": { # Often gives 403
@@ -235,258 +337,3111 @@ SCRAPING_TARGETS = {
         "port_index": 1,
         "pagination_selector": "div.paginator a:contains('Next')",
     },
+    # Raw lists (streamed, no HTML parsing)
+    "TheSpeedX/PROXY-List_http": {
+        "base_url": "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/http.txt",
+        "format": "text",
+        "protocol": "http",
+    },
+    "TheSpeedX/PROXY-List_socks5": {
+        "base_url": "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/master/socks5.txt",
+        "format": "text",
+        "protocol": "socks5",
+    },
+    "api.proxyscrape.com": {
+        "base_url": "https://api.proxyscrape.com/v2/?request=displayproxies&protocol=http&timeout=10000&country=all",
+        "format": "text",
+        "protocol": "http",
+    },
+    "proxylist.geonode.com": { # {"data": [{"ip": ..., "port": ...}, ...]}
+        "base_url": "https://proxylist.geonode.com/api/proxy-list?limit=500&page=1&sort_by=lastChecked&sort_type=desc",
+        "format": "json",
+        "json_ip_key": "ip",
+        "json_port_key": "port",
+    },
 }
 
-def get_html_content(session, url, site_name, attempt=1):
-    """Fetches HTML content from a given URL with random User-Agent and retry logic."""
-    headers = {
+# --- Run Metrics ---
+# Har site aur har validation stage ke counters/timings yahan jama hote hain; run ke end par JSON summary
+# aur Prometheus text file likhi jaati hai. PROFILE_STAGES on ho to kisi bhi stage ko cProfile se wrap kar sakte hain.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20) # Seconds; histogram upper bounds, +Inf is implied
+
+class RunMetrics:
+    """Thread-safe per-site and per-stage counters, latency histograms and optional per-stage profiles."""
+
+    SITE_FIELDS = ("pages_fetched", "pages_unchanged", "bytes", "fetch_seconds", "parse_seconds", "retries", "fetch_failures",
+                   "proxies_yielded")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.sites = {}
+        self.stages = {}
+        self.stage_finished = {} # Pipeline stage -> seconds into the run
+        self.gauges = {}
+        self.profiles = {} # Stage -> pstats.Stats
+        self.profile_skipped = 0
+
+    def site(self, site_name):
+        stats = self.sites.get(site_name)
+        if stats is None:
+            stats = self.sites[site_name] = dict.fromkeys(self.SITE_FIELDS, 0)
+        return stats
+
+    def add_site(self, site_name, **amounts):
+        with self.lock:
+            stats = self.site(site_name)
+            for field, amount in amounts.items():
+                stats[field] += amount
+
+    @staticmethod
+    def empty_stage():
+        return {"attempts": 0, "successes": 0, "timeouts": 0, "latency_sum": 0.0, "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+
+    def observe(self, stage, ok, seconds, timed_out=False):
+        """Records one validation attempt for a stage."""
+        with self.lock:
+            stats = self.stages.get(stage) or self.stages.setdefault(stage, self.empty_stage())
+            stats["attempts"] += 1
+            stats["successes"] += bool(ok)
+            stats["timeouts"] += bool(timed_out)
+            stats["latency_sum"] += seconds
+            stats["latency_buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def take_stages(self):
+        """Stage counters recorded since the last call, as JSON-friendly dicts; clears them (a worker's per-shard report)."""
+        with self.lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+    def merge_stages(self, stages):
+        """Adds stage counters recorded by another process (take_stages() output) to this run's."""
+        with self.lock:
+            for stage, other in stages.items():
+                stats = self.stages.get(stage) or self.stages.setdefault(stage, self.empty_stage())
+                for field in ("attempts", "successes", "timeouts", "latency_sum"):
+                    stats[field] += other[field]
+                stats["latency_buckets"] = [mine + theirs for mine, theirs in zip(stats["latency_buckets"], other["latency_buckets"])]
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def profiled(self, stage, function):
+        """Returns `function` wrapped in cProfile (results merged per stage) when PROFILE_STAGES is on."""
+        if not PROFILE_STAGES:
+            return function
+
+        def wrapper(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError: # Python 3.12+ allows only one active profiler at a time
+                with self.lock:
+                    self.profile_skipped += 1
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    if stage in self.profiles:
+                        self.profiles[stage].add(profile)
+                    else:
+                        self.profiles[stage] = pstats.Stats(profile)
+        return wrapper
+
+    def summary(self):
+        with self.lock:
+            stages = {}
+            for stage, stats in self.stages.items():
+                stages[stage] = {key: value for key, value in stats.items() if key != "latency_buckets"}
+                stages[stage]["latency_histogram"] = {
+                    str(bound): count for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats["latency_buckets"])}
+                stages[stage]["latency_mean"] = stats["latency_sum"] / stats["attempts"] if stats["attempts"] else None
+            return {
+                "started_at": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "duration_seconds": round(time.time() - self.started, 3),
+                "sites": {site_name: dict(stats) for site_name, stats in self.sites.items()},
+                "stages": stages,
+                "stage_finished_seconds": dict(self.stage_finished),
+                "gauges": dict(self.gauges),
+            }
+
+    def write_json(self, path=None):
+        with open(path or METRICS_JSON_FILE, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_prometheus(self, path=None):
+        """Writes the summary in Prometheus text exposition format (for node_exporter's textfile collector)."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP proxy_scraper_{name} {help_text}")
+            lines.append(f"# TYPE proxy_scraper_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{str(label).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                                      for key, label in labels.items())
+                lines.append(f"proxy_scraper_{name}{{{label_text}}} {value}" if label_text else f"proxy_scraper_{name} {value}")
+
+        site_help = {
+            "pages_fetched": "Pages fetched successfully",
+            "pages_unchanged": "Pages answered 304 or with an unchanged body, cached candidates reused",
+            "bytes": "Response bytes downloaded (on the wire, before decompression)",
+            "fetch_seconds": "Time spent fetching pages", "parse_seconds": "Time spent parsing pages",
+            "retries": "Fetch retries", "fetch_failures": "Pages given up on after all retries",
+            "proxies_yielded": "Candidate proxies extracted",
+        }
+        for field in self.SITE_FIELDS:
+            metric(f"site_{field}_total", "counter", site_help[field],
+                   [({"site": site_name}, stats[field]) for site_name, stats in summary["sites"].items()])
+        for field in ("attempts", "successes", "timeouts"):
+            metric(f"stage_{field}_total", "counter", f"Validation stage {field}",
+                   [({"stage": stage}, stats[field]) for stage, stats in summary["stages"].items()])
+        lines.append("# HELP proxy_scraper_stage_latency_seconds Validation attempt latency")
+        lines.append("# TYPE proxy_scraper_stage_latency_seconds histogram")
+        for stage, stats in summary["stages"].items():
+            cumulative = 0
+            for bound, count in stats["latency_histogram"].items():
+                cumulative += count
+                lines.append(f'proxy_scraper_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'proxy_scraper_stage_latency_seconds_sum{{stage="{stage}"}} {stats["latency_sum"]}')
+            lines.append(f'proxy_scraper_stage_latency_seconds_count{{stage="{stage}"}} {stats["attempts"]}')
+        metric("stage_finished_seconds", "gauge", "Seconds into the run when a pipeline stage finished",
+               [({"stage": stage}, seconds) for stage, seconds in summary["stage_finished_seconds"].items()])
+        for name, value in summary["gauges"].items():
+            metric(name, "gauge", name.replace("_", " ").capitalize(), [({}, value)])
+        metric("run_duration_seconds", "gauge", "Wall time of the run", [({}, summary["duration_seconds"])])
+        with open(path or METRICS_PROM_FILE, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write_profiles(self, directory=None):
+        """Dumps merged per-stage profiles as <stage>.prof files (open with pstats or snakeviz)."""
+        directory = directory or PROFILE_DIR
+        if not self.profiles:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for stage, stats in self.profiles.items():
+            paths.append(os.path.join(directory, f"{stage}.prof"))
+            stats.dump_stats(paths[-1])
+        return paths
+
+run_metrics = RunMetrics()
+
+def request_headers(url, accept='text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'):
+    """Browser-like request headers with a random User-Agent."""
+    return {
         'User-Agent': random.choice(USER_AGENTS),
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept': accept,
         'Accept-Language': 'en-US,en;q=0.5',
         'Referer': url # Referer header
     }
+
+def conditional_headers(headers, cached):
+    """Adds If-None-Match / If-Modified-Since from a page cache entry."""
+    if cached is not None and cached["etag"]:
+        headers['If-None-Match'] = cached["etag"]
+    if cached is not None and cached["last_modified"]:
+        headers['If-Modified-Since'] = cached["last_modified"]
+    return headers
+
+def wire_bytes(response, body_size):
+    """Bytes actually read from the socket (compressed size); falls back to the body size."""
     try:
-        response = session.get(url, headers=headers, timeout=TIMEOUT, allow_redirects=True)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        print(f"[{site_name}] Attempt {attempt}/{RETRY_ATTEMPTS}: Error fetching HTML from {url}: {e}")
-        if attempt < RETRY_ATTEMPTS:
-            time.sleep(RETRY_DELAY)
-            return get_html_content(session, url, site_name, attempt + 1)
+        return response.raw.tell() or body_size
+    except (AttributeError, ValueError):
+        return body_size
+
+def fetch_html(session, url, raw=False, cached=None):
+    """Fetches a URL with a random User-Agent (one attempt, raises on error).
+
+    Returns ((html, etag, last_modified, content_hash), bytes downloaded). With a page cache entry in `cached`
+    the request is conditional, and html is None when the server answers 304 Not Modified.
+    With `raw`, html is the undecoded response body, for parsing in another process.
+    """
+    response = session.get(url, headers=conditional_headers(request_headers(url), cached), timeout=TIMEOUT, allow_redirects=True)
+    response.raise_for_status()
+    etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    if response.status_code == 304:
+        return (None, etag, last_modified, None), wire_bytes(response, 0)
+    content_hash = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+    return ((response.content if raw else response.text), etag, last_modified, content_hash), wire_bytes(response, len(response.content))
+
+def retry_backoff(attempt):
+    """Jittered exponential backoff before retry number `attempt` (half fixed, half random)."""
+    delay = RETRY_DELAY * 2 ** (attempt - 1)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# --- Proxy Extraction ---
+# Har site ke selectors startup par ek baar compile hote hain. Simple selectors (tag, #id, .class,
+# [attr='value'], :contains('text'), descendant) seedha lxml XPath ban jaate hain; baaki soupsieve se
+# BeautifulSoup par chalte hain. Dono cases mein har page sirf ek baar parse hota hai.
+
+IP_TEXT_PATTERN = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+PORT_TEXT_PATTERN = re.compile(r'\d+')
+CSS_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<tag>\*|[a-zA-Z][\w-]*)
+  | \#(?P<id>[\w-]+)
+  | \.(?P<cls>[\w-]+)
+  | \[\s*(?P<attr>[\w-]+)\s*(?:=\s*(?P<quote>['"])(?P<value>.*?)(?P=quote)\s*)?\]
+  | :(?:-soup-)?contains\(\s*(?P<text_quote>['"])(?P<text>.*?)(?P=text_quote)\s*\)
+""", re.VERBOSE)
+NON_TEXT_TAGS = {"script", "style", "template"} # BeautifulSoup's get_text() skips these too
+
+def xpath_literal(value):
+    """Quotes a string for use inside an XPath expression."""
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return "concat('" + "', \"'\", '".join(value.split("'")) + "')"
+
+def css_to_xpath(selector):
+    """Translates the simple CSS subset used in SCRAPING_TARGETS to XPath; returns None if unsupported."""
+    steps = []
+    tag, predicates = None, []
+    position = 0
+    selector = selector.strip()
+    for match in CSS_TOKEN_PATTERN.finditer(selector):
+        if match.start() != position:
+            return None # Combinators like '>' or ',' and other pseudo-classes need soupsieve
+        position = match.end()
+        if match.group("space"):
+            if tag is None and not predicates:
+                return None
+            steps.append((tag, predicates))
+            tag, predicates = None, []
+        elif match.group("tag"):
+            if tag is not None or predicates:
+                return None
+            tag = match.group("tag").lower()
+        elif match.group("id"):
+            predicates.append(f"@id={xpath_literal(match.group('id'))}")
+        elif match.group("cls"):
+            predicates.append(f"contains(concat(' ', normalize-space(@class), ' '), {xpath_literal(' ' + match.group('cls') + ' ')})")
+        elif match.group("attr"):
+            if match.group("quote"):
+                predicates.append(f"@{match.group('attr')}={xpath_literal(match.group('value'))}")
+            else:
+                predicates.append(f"@{match.group('attr')}")
+        elif match.group("text_quote"):
+            predicates.append(f"contains(string(.), {xpath_literal(match.group('text'))})")
+        else:
+            return None
+    if position != len(selector) or (tag is None and not predicates):
         return None
+    steps.append((tag, predicates))
+    return "".join("//" + (tag or "*") + "".join(f"[{predicate}]" for predicate in preds) for tag, preds in steps)
 
-def extract_proxies_from_html(html_content, site_name, config):
-    """Extracts IP:PORT proxies from HTML using BeautifulSoup."""
-    proxies = []
-    if not html_content:
-        return proxies
+def element_text(element):
+    """lxml equivalent of BeautifulSoup's get_text(strip=True)."""
+    if len(element) == 0:
+        return (element.text or "").strip()
+    parts = []
+
+    def collect(node):
+        if isinstance(node.tag, str) and node.tag not in NON_TEXT_TAGS: # Comments have a non-str tag
+            if node.text:
+                parts.append(node.text.strip())
+            for child in node:
+                collect(child)
+                if child.tail:
+                    parts.append(child.tail.strip())
+
+    collect(element)
+    return "".join(parts)
+
+def extractor_fingerprint(*settings):
+    """Short hash of the config an extractor reads, so cached candidates die with a selector change."""
+    return hashlib.blake2b(json.dumps(settings).encode(), digest_size=8).hexdigest()
+
+class SiteExtractor:
+    """A site's selectors compiled once; parse() turns a page into (proxies, next_page_href) in one pass."""
+
+    def __init__(self, site_name, config):
+        self.site_name = site_name
+        self.ip_index = config.get("ip_index")
+        self.port_index = config.get("port_index")
+        self.row_selector = config.get("ip_port_selector")
+        self.pagination_selector = config.get("pagination_selector")
+        self.fingerprint = extractor_fingerprint(self.row_selector, self.pagination_selector, self.ip_index, self.port_index)
+        self.valid = bool(self.row_selector) and self.ip_index is not None and self.port_index is not None
+        if not self.valid:
+            print(f"[{site_name}] Error: Missing ip_port_selector, ip_index, or port_index in config. Skipping site.")
+            return
+        self.min_cells = max(self.ip_index, self.port_index) + 1
+
+        row_xpath = css_to_xpath(self.row_selector)
+        pagination_xpath = css_to_xpath(self.pagination_selector) if self.pagination_selector else None
+        self.use_lxml = row_xpath is not None and (not self.pagination_selector or pagination_xpath is not None)
+        if self.use_lxml:
+            self.row_xpath = etree.XPath(row_xpath)
+            self.pagination_xpath = etree.XPath(pagination_xpath) if pagination_xpath else None
+        # soupsieve patterns are always compiled, they back up lxml on pages it refuses to parse
+        self.row_css = soupsieve.compile(self.row_selector)
+        self.pagination_css = soupsieve.compile(self.pagination_selector) if self.pagination_selector else None
+
+    def parse(self, html_content):
+        """Returns (proxies, next_page_href) for one page; next_page_href is None if there is no next link."""
+        if not self.valid or not html_content:
+            return [], None
+        if self.use_lxml:
+            try:
+                return self.parse_with_lxml(lxml.html.document_fromstring(html_content))
+            except (etree.ParserError, ValueError):
+                pass # e.g. str input with an XML encoding declaration
+        return self.parse_with_soup(BeautifulSoup(html_content, 'lxml'))
+
+    def parse_with_lxml(self, document):
+        proxies = []
+        for row in self.row_xpath(document):
+            cells = list(row.iterdescendants('td'))
+            if len(cells) >= self.min_cells:
+                self.add_proxy(proxies, element_text(cells[self.ip_index]), element_text(cells[self.port_index]))
+        next_href = None
+        if self.pagination_xpath is not None:
+            links = self.pagination_xpath(document)
+            if links:
+                next_href = links[0].get('href')
+        return proxies, next_href
 
-    soup = BeautifulSoup(html_content, 'lxml')
-    selector = config.get("ip_port_selector")
-    ip_index = config.get("ip_index")
-    port_index = config.get("port_index")
+    def parse_with_soup(self, soup):
+        proxies = []
+        for row in self.row_css.select(soup):
+            cells = row.find_all('td')
+            if len(cells) >= self.min_cells:
+                self.add_proxy(proxies, cells[self.ip_index].get_text(strip=True), cells[self.port_index].get_text(strip=True))
+        next_href = None
+        if self.pagination_css is not None:
+            link = self.pagination_css.select_one(soup)
+            if link is not None and link.has_attr('href'):
+                next_href = link['href']
+        return proxies, next_href
 
-    if not all([selector, ip_index is not None, port_index is not None]):
-        print(f"[{site_name}] Error: Missing ip_port_selector, ip_index, or port_index in config. Skipping site.")
+    @staticmethod
+    def add_proxy(proxies, ip_text, port_text):
+        if IP_TEXT_PATTERN.match(ip_text) and PORT_TEXT_PATTERN.match(port_text):
+            proxies.append(f"{ip_text}:{port_text}")
+
+# --- Stream Extraction ---
+# "format": "text"/"json" sources poore response ko kabhi memory mein nahi rakhte: chunks aate hi scanner
+# unme se candidates nikalta hai. Chunk boundary par kata hua ip:port ya JSON record agle chunk ke saath poora hota hai,
+# isliye memory list ke size par nahi, sirf chunk aur ek record ke size par depend karti hai.
+
+TEXT_PROXY_PATTERN = re.compile(rb'(?<![\d.])\d{1,3}(?:\.\d{1,3}){3}:\d{1,5}(?!\d)')
+TEXT_PROXY_BYTES = frozenset(b"0123456789.:")
+JSON_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|"|[{}\[\]]') # A whole string, an unterminated one, or a bracket
+JSON_PROXY_STRING_PATTERN = re.compile(TEXT_PROXY_PATTERN.pattern.decode())
+JSON_MAX_RECORD_CHARS = 1024 * 1024 # A "record" that still doesn't parse at this size is skipped, not buffered further
+
+class TextListScanner:
+    """Finds ip:port candidates in a byte stream of any layout (one per line, comma separated, scheme://ip:port ...)."""
+
+    def __init__(self):
+        self.tail = b"" # Trailing bytes that may be the start of a candidate cut by the chunk boundary
+
+    def feed(self, chunk):
+        data = self.tail + chunk
+        cut = len(data)
+        while cut > 0 and data[cut - 1] in TEXT_PROXY_BYTES and len(data) - cut < 21: # 21 = len("255.255.255.255:65535")
+            cut -= 1
+        self.tail = data[cut:]
+        return [match.decode() for match in TEXT_PROXY_PATTERN.findall(data, 0, cut)]
+
+    def close(self):
+        data, self.tail = self.tail, b""
+        return [match.decode() for match in TEXT_PROXY_PATTERN.findall(data)]
+
+class JsonRecordScanner:
+    """Incremental JSON scanner: every object directly inside an array is a record, decoded on its own as soon as it is complete.
+
+    Only the pending record (or an unterminated string) is buffered, so `{"data": [...]}` and top-level arrays of
+    any length take constant memory. Strings directly inside an array are matched as "ip:port" too.
+    """
+
+    def __init__(self, ip_key="ip", port_key="port"):
+        self.ip_key = ip_key
+        self.port_key = port_key
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.json_decoder = json.JSONDecoder()
+        self.text = ""
+        self.stack = [] # Containers open around the scan position, "{" or "["
+
+    def feed(self, chunk):
+        text = self.text + self.decoder.decode(chunk)
+        proxies = []
+        position = 0
+        while match := JSON_TOKEN_PATTERN.search(text, position):
+            token = match.group()
+            if token == '"': # String continues in the next chunk
+                position = match.start()
+                break
+            in_array = bool(self.stack) and self.stack[-1] == "["
+            if token == "{" and in_array:
+                try:
+                    record, position = self.json_decoder.raw_decode(text, match.start()) # Whole record in C
+                except ValueError:
+                    if len(text) - match.start() < JSON_MAX_RECORD_CHARS:
+                        position = match.start() # Record continues in the next chunk
+                        break
+                    self.stack.append(token) # Broken or huge: walk through it without decoding
+                    position = match.end()
+                    continue
+                self.add_record(proxies, record)
+                continue
+            position = match.end()
+            if token[0] == '"':
+                if in_array and JSON_PROXY_STRING_PATTERN.fullmatch(token, 1, len(token) - 1):
+                    proxies.append(token[1:-1])
+            elif token in ("{", "["):
+                self.stack.append(token)
+            elif self.stack:
+                self.stack.pop()
+        else:
+            position = len(text)
+        self.text = text[position:]
         return proxies
 
-    rows = soup.select(selector)
+    def add_record(self, proxies, record):
+        if not isinstance(record, dict):
+            return
+        ip, port = record.get(self.ip_key), record.get(self.port_key)
+        if isinstance(ip, str) and port is None and ":" in ip:
+            ip, port = ip.rsplit(":", 1)
+        if ip is not None and port is not None:
+            SiteExtractor.add_proxy(proxies, str(ip), str(port))
 
-    if not rows:
-        # print(f"[{site_name}] Warning: No rows found with selector '{selector}' on current page.")
-        pass
+    def close(self):
+        return [] # An unfinished record at the end of the stream is dropped
 
-    for row in rows:
-        cells = row.find_all('td')
-        if len(cells) > max(ip_index, port_index):
-            ip_text = cells[ip_index].get_text(strip=True)
-            port_text = cells[port_index].get_text(strip=True)
+class StreamExtractor:
+    """A "format": "text"/"json" site; scanner() returns fresh scanner state for one response stream."""
 
-            # Some sites obfuscate IP, try to decode if not standard IP format
-            # For example, free-proxy-list.net often encodes IP in a script
-            if site_name == "free-proxy-list.net" and re.match(r'[a-zA-Z0-9]+', ip_text):
-                # This part is highly site-specific and may need to be generalized or removed.
-                # Currently, free-proxy-list.net IPs are mostly plain text.
-                pass # For now, assuming it's plain text. If it's JS encoded, this won't work.
+    def __init__(self, site_name, config):
+        self.site_name = site_name
+        self.format = config.get("format")
+        self.ip_key = config.get("json_ip_key", "ip")
+        self.port_key = config.get("json_port_key", "port")
+        self.fingerprint = extractor_fingerprint(self.format, self.ip_key, self.port_key)
+        self.valid = self.format in ("text", "json") and bool(config.get("base_url"))
+        if not self.valid:
+            print(f"[{site_name}] Error: Unknown format {self.format!r} or missing base_url in config. Skipping site.")
 
-            if re.match(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}', ip_text) and re.match(r'\d+', port_text):
-                proxies.append(f"{ip_text}:{port_text}")
-    return proxies
+    def scanner(self):
+        return TextListScanner() if self.format == "text" else JsonRecordScanner(self.ip_key, self.port_key)
 
-def scrape_website_pages(site_name, config):
-    """Scrapes proxies from all pages of a given website."""
-    all_site_proxies = []
-    visited_urls = set()
-    urls_to_visit = [config["base_url"]]
-    
-    session = requests.Session() # Use a session for better connection management
-    
-    print(f"\n--- Starting scraping for {site_name} ---")
-
-    page_count = 0
-    max_pages = config.get("max_pages_to_scrape", MAX_SCRAPING_PAGES)
-
-    while urls_to_visit and page_count < max_pages:
-        current_url = urls_to_visit.pop(0)
-        if current_url in visited_urls:
-            print(f"[{site_name}] Already visited: {current_url}. Skipping.")
-            continue
-
-        print(f"[{site_name}] Scraping page {page_count + 1}/{max_pages}: {current_url}")
-        visited_urls.add(current_url)
-        html_content = get_html_content(session, current_url, site_name)
-
-        if not html_content:
-            print(f"[{site_name}] Failed to get HTML for {current_url} after retries. Skipping page.")
-            continue
-
-        page_proxies = extract_proxies_from_html(html_content, site_name, config)
-        all_site_proxies.extend(page_proxies)
-        
-        soup = BeautifulSoup(html_content, 'lxml')
-        next_url = None
-
-        # --- Pagination Logic ---
-        if "pagination_selector" in config:
-            next_page_link = soup.select_one(config["pagination_selector"])
-            if next_page_link and next_page_link.has_attr('href'):
-                next_url = urljoin(current_url, next_page_link['href'])
-                # Some sites like hidemy.name use a 'start' parameter even with a 'next' link selector
-                # Check for "start" parameter in next_url, if it's there, convert to offset type pagination if needed
-                parsed_next_url = urlparse(next_url)
-                query_params = parse_qs(parsed_next_url.query)
-                if config.get("pagination_type") == "offset" and config.get("offset_param") in query_params:
-                    # If it's an offset type and selector gives a link, prioritize the offset logic
-                    # This prevents mixing logic, ensures consistent offset step.
-                    print(f"[{site_name}] Pagination selector found, but offset type is preferred. Reverting to offset logic for next URL.")
-                    pass # Will be handled by offset logic below if it matches
-                elif next_url == current_url:
+def stream_candidates(session, url, extractor, emit, site_name):
+    """Streams a list through the extractor's scanner, calling emit(batch) every STREAM_BATCH_SIZE candidates; returns (candidates, bytes).
+
+    With the page cache on, the request is conditional; a 304 replays the candidates cached from the last download,
+    unpacking one batch at a time. Lists longer than PAGE_CACHE_MAX_CANDIDATES are not cached.
+    """
+    cached = page_cache.get(url, extractor.fingerprint) if page_cache is not None else None
+    headers = conditional_headers(request_headers(url, 'text/plain,application/json;q=0.9,*/*;q=0.8'), cached)
+    found = byte_count = 0
+    scan_seconds = 0.0
+    batch = []
+    packed = array('Q') if page_cache is not None else None # For the page cache, 8 bytes per candidate
+    scanner = extractor.scanner()
+    with session.get(url, headers=headers, timeout=TIMEOUT, allow_redirects=True, stream=True) as response:
+        response.raise_for_status()
+        if response.status_code == 304 and cached is not None:
+            run_metrics.add_site(site_name, pages_unchanged=1)
+            page_cache.touch(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            cached_packed = cached["packed"]
+            for offset in range(0, len(cached_packed), STREAM_BATCH_SIZE):
+                emit([unpack_candidate(value) for value in cached_packed[offset:offset + STREAM_BATCH_SIZE]])
+            return len(cached_packed), wire_bytes(response, 0)
+        for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+            started = time.perf_counter()
+            batch.extend(scanner.feed(chunk))
+            scan_seconds += time.perf_counter() - started
+            if len(batch) >= STREAM_BATCH_SIZE:
+                if packed is not None:
+                    packed.extend(filter(None, map(pack_candidate, batch)))
+                    if len(packed) > PAGE_CACHE_MAX_CANDIDATES:
+                        packed = None # Too big to cache, memory stays flat
+                emit(batch)
+                found += len(batch)
+                batch = []
+        batch.extend(scanner.close())
+        byte_count = wire_bytes(response, 0)
+    if batch:
+        if packed is not None:
+            packed.extend(filter(None, map(pack_candidate, batch)))
+        emit(batch)
+        found += len(batch)
+    run_metrics.add_site(site_name, parse_seconds=scan_seconds)
+    if packed is not None and len(packed) <= PAGE_CACHE_MAX_CANDIDATES:
+        page_cache.put(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), None, packed, None,
+                       extractor.fingerprint)
+    elif page_cache is not None:
+        page_cache.discard(url) # Its validators would otherwise replay a list that is out of date
+    return found, byte_count
+
+site_extractors = {} # site_name -> SiteExtractor or StreamExtractor, filled by compile_site_extractors()
+
+def make_site_extractor(site_name, config):
+    return (StreamExtractor if config.get("format", "html") != "html" else SiteExtractor)(site_name, config)
+
+def compile_site_extractors(targets=None):
+    """Compiles every site's selectors once; called at startup."""
+    for site_name, config in (targets or SCRAPING_TARGETS).items():
+        site_extractors[site_name] = make_site_extractor(site_name, config)
+    return site_extractors
+
+def get_site_extractor(site_name, config):
+    """Returns the compiled extractor for a site, compiling it on first use."""
+    extractor = site_extractors.get(site_name)
+    if extractor is None:
+        extractor = site_extractors[site_name] = make_site_extractor(site_name, config)
+    return extractor
+
+def extract_proxies_from_html(html_content, site_name, config):
+    """Extracts IP:PORT proxies from HTML using the site's compiled extractor."""
+    return get_site_extractor(site_name, config).parse(html_content)[0]
+
+def init_parse_worker(targets):
+    """Parse process initializer: compiles every site's extractor once per worker."""
+    warnings.simplefilter("ignore", FutureWarning) # soupsieve's ':contains' notice, the parent process already showed it
+    compile_site_extractors(targets)
+
+def parse_in_worker(site_name, page):
+    """Runs in a parse process: raw page bytes in, only the compact (proxies, next_page_href) result back."""
+    return site_extractors[site_name].parse(page)
+
+def start_parse_pool(targets, processes=None):
+    """Process pool for parsing with extractors precompiled in every worker."""
+    # spawn, not fork: the scheduler's fetch threads are already running when the pool starts
+    return ProcessPoolExecutor(max_workers=processes or PARSE_PROCESSES or os.cpu_count(),
+                               mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_parse_worker, initargs=(targets,))
+
+# --- Page Cache ---
+# Har source URL ka ETag, Last-Modified, body hash aur usse nikle candidates (packed) SQLite mein rehte hain.
+# Agle run mein request conditional jaati hai; 304 ya same hash par page dobara parse nahi hota,
+# purane candidates hi dedup ko jaate hain (validation unki phir bhi hoti hai).
+
+class PageCache:
+    """On-disk cache of source pages: HTTP validators, body hash and the candidates extracted from each URL."""
+
+    def __init__(self, path=None):
+        self.path = path or PAGE_CACHE_FILE
+        self.connection = sqlite3.connect(self.path, check_same_thread=False) # Used from the fetch threads
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS page_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                proxies BLOB NOT NULL,
+                next_href TEXT,
+                checked_at REAL NOT NULL,
+                extractor TEXT
+            )""")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(page_cache)")]
+        if "extractor" not in columns: # Cache from before extractor fingerprints; its rows just miss once
+            self.connection.execute("ALTER TABLE page_cache ADD COLUMN extractor TEXT")
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM page_cache").fetchone()[0]
+
+    def get(self, url, fingerprint=None):
+        """Cache entry for a URL as a dict (candidates still packed, an array('Q') under "packed"), or None.
+
+        A row extracted with a different extractor config (`fingerprint`) is a miss, it has to be parsed again.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT etag, last_modified, content_hash, proxies, next_href, extractor FROM page_cache WHERE url = ?",
+                (url,)).fetchone()
+        if row is None or row[5] != fingerprint:
+            return None
+        etag, last_modified, content_hash, blob, next_href, _ = row
+        packed = array('Q')
+        packed.frombytes(blob)
+        return {"etag": etag, "last_modified": last_modified, "content_hash": content_hash,
+                "packed": packed, "next_href": next_href}
+
+    def put(self, url, etag, last_modified, content_hash, proxies, next_href, fingerprint=None):
+        """Stores a freshly extracted page; `proxies` are 'ip:port' strings or an array('Q') of packed candidates."""
+        if not isinstance(proxies, array):
+            proxies = array('Q', filter(None, map(pack_candidate, proxies)))
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO page_cache (url, etag, last_modified, content_hash, proxies, next_href, checked_at, extractor) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, proxies.tobytes(), next_href, time.time(), fingerprint))
+
+    def discard(self, url):
+        with self.lock:
+            self.connection.execute("DELETE FROM page_cache WHERE url = ?", (url,))
+
+    def touch(self, url, etag=None, last_modified=None):
+        """Marks an unchanged page as checked, keeping any new validators the server sent."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE page_cache SET checked_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                "WHERE url = ?", (time.time(), etag, last_modified, url))
+
+    def flush(self):
+        """Commits and drops URLs not checked for PAGE_CACHE_RETENTION seconds."""
+        with self.lock:
+            self.connection.execute("DELETE FROM page_cache WHERE checked_at < ?", (time.time() - PAGE_CACHE_RETENTION,))
+            self.connection.commit()
+
+    def save(self):
+        self.flush()
+        self.connection.close()
+
+page_cache = None # Opened by open_state() when USE_PAGE_CACHE is on
+
+# --- Scrape Scheduler ---
+# Saari sites ek event loop par coroutines ki tarah chalti hain. Politeness har host ke token bucket se
+# aati hai (sleep karte threads se nahi), aur SCRAPING_CONCURRENCY poore run ki in-flight requests limit karta hai.
+# Offset pagination waali sites ke next URLs pehle se pata hote hain, isliye unke pages ek saath fetch hote hain.
+
+class TokenBucket:
+    """Async token bucket allowing `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock: # Waiters queue up in order instead of racing for the next token
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def offset_page_url(config, page_index):
+    """URL of page `page_index` (0-based) for offset-paginated sites, keeping the base URL's path and query."""
+    if page_index == 0:
+        return config["base_url"]
+    base_url_parsed = urlparse(config["base_url"])
+    query_params = parse_qs(base_url_parsed.query)
+    query_params[config["offset_param"]] = [str(page_index * config.get("offset_step", 64))]
+    return base_url_parsed._replace(query=urlencode(query_params, doseq=True)).geturl()
+
+class ScrapeScheduler:
+    """Scrapes sites concurrently under per-host rate limits and a global in-flight request limit."""
+
+    def __init__(self, max_inflight=None, page_sink=None):
+        max_inflight = max_inflight or SCRAPING_CONCURRENCY
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.page_sink = page_sink # Optional coroutine fn taking (site_name, page_proxies); sites then return []
+        # Blocking requests/parsing run here; threads are only busy while a request or parse is running
+        self.executor = ThreadPoolExecutor(max_workers=max_inflight)
+        self.parse_pool = None # Set by scrape_all() when PARSE_IN_PROCESSES is on
+        self.buckets = {}
+        self.sessions = {} # Host -> requests.Session, so sites on one host share keep-alive connections
+
+    def bucket_for(self, url):
+        host = urlparse(url).hostname
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(1 / SCRAPING_DELAY, SCRAPING_BURST)
+        return bucket
+
+    def session_for(self, url):
+        """Keep-alive session for the URL's host; requests negotiates gzip (and brotli when installed) on its own."""
+        host = urlparse(url).hostname
+        session = self.sessions.get(host)
+        if session is None:
+            session = self.sessions[host] = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=SCRAPING_CONCURRENCY)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+    async def fetch_page_proxies(self, url, site_name, extractor, attempts=RETRY_ATTEMPTS):
+        """Fetches and parses a page into (proxies, next_page_href), or None if every attempt failed.
+
+        Backoff waits happen on the event loop, not in a worker thread. A page the cache says is unchanged
+        (304, or the same body hash) is not parsed; its cached candidates are returned instead.
+        """
+        cached = page_cache.get(url, extractor.fingerprint) if page_cache is not None else None
+        page = await self.fetch_with_retries(site_name, url, attempts, fetch_html,
+                                             self.session_for(url), url, self.parse_pool is not None, cached)
+        if page is None:
+            return None
+        html_content, etag, last_modified, content_hash = page
+        if cached is not None and (html_content is None or content_hash == cached["content_hash"]):
+            run_metrics.add_site(site_name, pages_unchanged=1)
+            page_cache.touch(url, etag, last_modified)
+            return [unpack_candidate(value) for value in cached["packed"]], cached["next_href"]
+        if html_content is None:
+            return None # 304 for a URL that is no longer cached
+        result = await self.parse_page(extractor, html_content)
+        if page_cache is not None:
+            page_cache.put(url, etag, last_modified, content_hash, *result, extractor.fingerprint)
+        return result
+
+    async def fetch_with_retries(self, site_name, url, attempts, fetch, *args):
+        """Runs fetch(*args) -> (result, bytes) in a fetch thread with retries; returns result, or None if every attempt failed."""
+        loop = asyncio.get_running_loop()
+        fetch = run_metrics.profiled("fetch", fetch)
+        for attempt in range(1, attempts + 1):
+            await self.bucket_for(url).acquire()
+            async with self.inflight:
+                started = time.perf_counter()
+                try:
+                    result, byte_count = await loop.run_in_executor(self.executor, fetch, *args)
+                    run_metrics.add_site(site_name, pages_fetched=1, bytes=byte_count,
+                                         fetch_seconds=time.perf_counter() - started)
+                    return result
+                except requests.exceptions.RequestException as e:
+                    run_metrics.add_site(site_name, fetch_seconds=time.perf_counter() - started)
+                    print(f"[{site_name}] Attempt {attempt}/{attempts}: Error fetching HTML from {url}: {e}")
+            if attempt < attempts:
+                run_metrics.add_site(site_name, retries=1)
+                await asyncio.sleep(retry_backoff(attempt))
+        run_metrics.add_site(site_name, fetch_failures=1)
+        return None
+
+    async def parse_page(self, extractor, html_content):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        if self.parse_pool is not None:
+            result = await loop.run_in_executor(self.parse_pool, parse_in_worker, extractor.site_name, html_content)
+        else:
+            result = await loop.run_in_executor(self.executor, run_metrics.profiled("parse", extractor.parse), html_content)
+        run_metrics.add_site(extractor.site_name, parse_seconds=time.perf_counter() - started)
+        return result
+
+    async def emit_page(self, site_name, page_proxies, all_site_proxies):
+        """Streams a page's proxies to the page sink if there is one, else collects them for the site's result."""
+        run_metrics.add_site(site_name, proxies_yielded=len(page_proxies))
+        if self.page_sink is not None:
+            await self.page_sink((site_name, page_proxies))
+        else:
+            all_site_proxies.extend(page_proxies)
+
+    async def scrape_site(self, site_name, config):
+        """Scrapes proxies from all pages of a given website."""
+        print(f"\n--- Starting scraping for {site_name} ---")
+        all_site_proxies = []
+        if config.get("format", "html") != "html":
+            found = await self.scrape_stream(site_name, config, all_site_proxies)
+        elif config.get("pagination_type") == "offset":
+            found = await self.scrape_offset_pages(site_name, config, all_site_proxies)
+        else:
+            found = await self.scrape_linked_pages(site_name, config, all_site_proxies)
+        print(f"--- Finished scraping {site_name}. Found {found} proxies. ---")
+        return all_site_proxies
+
+    async def scrape_stream(self, site_name, config, all_site_proxies):
+        """Text/JSON list sources: one streamed request whose candidates reach dedup in batches while it downloads."""
+        extractor = get_site_extractor(site_name, config)
+        if not extractor.valid:
+            return 0
+        loop = asyncio.get_running_loop()
+
+        def emit(batch):
+            # Called from the fetch thread; blocks while the pipeline's page queue is full
+            asyncio.run_coroutine_threadsafe(self.emit_page(site_name, batch, all_site_proxies), loop).result()
+
+        url = config["base_url"]
+        print(f"[{site_name}] Streaming {extractor.format} list: {url}")
+        # A retry after a partial download re-sends its candidates; dedup drops the repeats
+        found = await self.fetch_with_retries(site_name, url, config.get("retry_attempts", RETRY_ATTEMPTS),
+                                              lambda: stream_candidates(self.session_for(url), url, extractor, emit, site_name))
+        if found is None:
+            print(f"[{site_name}] Failed to stream {url} after retries. Skipping site.")
+        return found or 0
+
+    async def scrape_offset_pages(self, site_name, config, all_site_proxies):
+        """Offset pagination (like hidemy.name): every page URL is known up front, so pages are fetched concurrently."""
+        extractor = get_site_extractor(site_name, config)
+        max_pages = config.get("max_pages_to_scrape", MAX_SCRAPING_PAGES)
+        urls = [offset_page_url(config, page_index) for page_index in range(max_pages)]
+        # Buckets hand out tokens in request order, so earlier pages still go out first
+        attempts = config.get("retry_attempts", RETRY_ATTEMPTS)
+        fetches = [asyncio.ensure_future(self.fetch_page_proxies(url, site_name, extractor, attempts)) for url in urls]
+        found = 0
+        try:
+            for page_index, (url, fetch) in enumerate(zip(urls, fetches)):
+                print(f"[{site_name}] Scraping page {page_index + 1}/{max_pages}: {url}")
+                page = await fetch
+                if page is None:
+                    print(f"[{site_name}] Failed to get HTML for {url} after retries. Skipping page.")
+                    continue
+                page_proxies, _ = page
+                found += len(page_proxies)
+                await self.emit_page(site_name, page_proxies, all_site_proxies)
+                if not page_proxies:
+                    print(f"[{site_name}] No new proxies found on {url}, stopping pagination for this site early.")
+                    break
+        finally:
+            for fetch in fetches:
+                fetch.cancel() # Pages past the end of the list are not needed
+        return found
+
+    async def scrape_linked_pages(self, site_name, config, all_site_proxies):
+        """Follows the site's 'next' link page by page."""
+        found = 0
+        visited_urls = set()
+        urls_to_visit = [config["base_url"]]
+        extractor = get_site_extractor(site_name, config)
+
+        page_count = 0
+        max_pages = config.get("max_pages_to_scrape", MAX_SCRAPING_PAGES)
+
+        while urls_to_visit and page_count < max_pages:
+            current_url = urls_to_visit.pop(0)
+            if current_url in visited_urls:
+                print(f"[{site_name}] Already visited: {current_url}. Skipping.")
+                continue
+
+            print(f"[{site_name}] Scraping page {page_count + 1}/{max_pages}: {current_url}")
+            visited_urls.add(current_url)
+            # One parse per page (or none if it is unchanged), shared by row extraction and pagination
+            page = await self.fetch_page_proxies(current_url, site_name, extractor, config.get("retry_attempts", RETRY_ATTEMPTS))
+
+            if page is None:
+                print(f"[{site_name}] Failed to get HTML for {current_url} after retries. Skipping page.")
+                continue
+
+            page_proxies, next_page_href = page
+            found += len(page_proxies)
+            await self.emit_page(site_name, page_proxies, all_site_proxies)
+
+            next_url = None
+            if "pagination_selector" in config and next_page_href is not None:
+                next_url = urljoin(current_url, next_page_href)
+                if next_url == current_url:
                     print(f"[{site_name}] Pagination link points to current URL ({current_url}). Stopping.")
                     next_url = None # Stop if next link is current page
+
+            if next_url and next_url not in visited_urls and page_proxies:
+                urls_to_visit.append(next_url)
+            elif not next_url:
+                print(f"[{site_name}] No further pagination link found or recognized for {current_url}. Stopping for this site.")
+                break # Stop scraping this site
+            elif next_url and not page_proxies:
+                print(f"[{site_name}] No new proxies found on {current_url}, stopping pagination for this site early.")
+                break # Stop scraping this site
+
+            page_count += 1 # Increment page count *after* processing next_url to ensure page limit is correctly applied
+
+        return found
+
+    async def scrape_all(self, targets=None):
+        """Scrapes every usable site in `targets` concurrently, in `targets` order; returns {site_name: proxies}."""
+        sites = {site_name: config for site_name, config in (targets or SCRAPING_TARGETS).items()
+                 if config.get("format", "html") != "html" or all(k in config for k in ["ip_port_selector", "ip_index", "port_index"])}
+        if PARSE_IN_PROCESSES and self.parse_pool is None:
+            self.parse_pool = start_parse_pool(sites)
+        results = await asyncio.gather(*(self.scrape_site(site_name, config) for site_name, config in sites.items()),
+                                       return_exceptions=True)
+        scraped = {}
+        for site_name, result in zip(sites, results):
+            if isinstance(result, Exception):
+                print(f'[{site_name}] Scraping generated an exception: {result}')
             else:
-                # print(f"[{site_name}] No 'next' link found with selector '{config['pagination_selector']}' on {current_url}")
-                pass # No next link, so next_url remains None
-
-        # Type 2: Offset-based pagination (like hidemy.name) - if primary selector didn't work or this is preferred
-        if config.get("pagination_type") == "offset":
-            # Re-evaluate next_url based on offset logic, potentially overriding selector-based next_url
-            parsed_current_url = urlparse(current_url)
-            current_query_params = parse_qs(parsed_current_url.query)
-            current_offset = 0
-            if config.get("offset_param") in current_query_params:
-                try:
-                    current_offset = int(current_query_params[config["offset_param"]][0])
-                except (ValueError, IndexError):
-                    print(f"[{site_name}] Warning: Invalid offset parameter in URL: {current_query_params[config['offset_param']]}")
-
-            next_offset = current_offset + config.get("offset_step", 64)
-
-            # Ensure the base URL's path is used, not just the base domain
-            base_url_parsed = urlparse(config["base_url"])
-            next_query_params = current_query_params.copy()
-            next_query_params[config["offset_param"]] = [str(next_offset)]
-
-            next_url = base_url_parsed._replace(query=urlencode(next_query_params, doseq=True)).geturl()
-            # print(f"[{site_name}] Offset pagination: Current offset {current_offset}, Next offset {next_offset}, Next URL: {next_url}")
-
-
-        if next_url and next_url not in visited_urls and page_proxies:
-            urls_to_visit.append(next_url)
-        elif not next_url:
-            print(f"[{site_name}] No further pagination link found or recognized for {current_url}. Stopping for this site.")
-            break # Stop scraping this site
-        elif next_url and not page_proxies:
-            print(f"[{site_name}] No new proxies found on {current_url}, stopping pagination for this site early.")
-            break # Stop scraping this site
-        
-        page_count += 1 # Increment page count *after* processing next_url to ensure page limit is correctly applied
-        time.sleep(SCRAPING_DELAY)
-
-    print(f"--- Finished scraping {site_name}. Found {len(all_site_proxies)} proxies. ---")
-    return all_site_proxies
-
-def test_proxy(session, proxy):
-    """Tests if a proxy is working using the provided session."""
-    try:
-        proxies_dict = {
-            'http': f'http://{proxy}',
-            'https': f'https://{proxy}'
+                scraped[site_name] = result
+        return scraped
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.executor.shutdown(wait=False)
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False, cancel_futures=True)
+
+def scrape_all_sites(targets=None):
+    """Runs the scrape scheduler over every configured site and returns {site_name: proxies}."""
+    async def run():
+        scheduler = ScrapeScheduler()
+        try:
+            return await scheduler.scrape_all(targets)
+        finally:
+            scheduler.close()
+    return asyncio.run(run())
+
+def scrape_website_pages(site_name, config):
+    """Scrapes proxies from all pages of a single website."""
+    return scrape_all_sites({site_name: config}).get(site_name, [])
+
+# --- Source Stats ---
+# Har site ka hisaab runs ke beech SOURCE_STATS_FILE mein rehta hai: kitni requests, kitne pages mile,
+# kitne candidates, kitne sirf isi site par the (unique) aur kitne working nikle. Inse agle run ka plan banta hai:
+# zyada working-per-request waali sites pehle aur zyada pages ke saath, blocked sites bina retry ke,
+# aur lagataar barren sites probation par (beech beech mein sirf ek sasta re-probe).
+
+class SourceTally:
+    """This run's attribution: which sites listed each candidate.
+
+    A working proxy's credit is split evenly between the sites that listed it, so a site repeating
+    other lists earns little; `unique` counts candidates no other site had. Each (candidate, site) pair
+    is one packed << 16 | site index value in a CandidateSet, 8 bytes, so a candidate's sites sit next
+    to each other in the sorted array. Credits are worked out once, at the end of the run.
+    """
+
+    def __init__(self):
+        self.site_names = []
+        self.site_indexes = {} # site_name -> index into site_names
+        self.listings = CandidateSet() # packed candidate << 16 | site index
+        self.working_packed = array('Q')
+
+    def add(self, site_name, packed):
+        index = self.site_indexes.get(site_name)
+        if index is None:
+            index = self.site_indexes[site_name] = len(self.site_names)
+            self.site_names.append(site_name)
+        self.listings.add_packed(packed << 16 | index)
+
+    def credit_working(self, proxy):
+        packed = pack_candidate(proxy)
+        if packed is not None:
+            self.working_packed.append(packed)
+
+    def working(self):
+        """Working proxies per site, each proxy's credit split between the sites that listed it."""
+        listings = self.listings.packed_values()
+        credit = {}
+        for packed in self.working_packed:
+            start = bisect.bisect_left(listings, packed << 16)
+            site_values = listings[start:bisect.bisect_left(listings, (packed + 1) << 16, start)]
+            for value in site_values: # Known-good proxies no site listed this run earn nobody credit
+                site_name = self.site_names[value & 0xFFFF]
+                credit[site_name] = credit.get(site_name, 0) + 1 / len(site_values)
+        return credit
+
+    def unique(self):
+        counts = {}
+        previous = None
+        shared = False
+        for value in self.listings.packed_values():
+            if previous is not None and value >> 16 == previous >> 16:
+                shared = True
+                continue
+            if previous is not None and not shared:
+                site_name = self.site_names[previous & 0xFFFF]
+                counts[site_name] = counts.get(site_name, 0) + 1
+            previous, shared = value, False
+        if previous is not None and not shared:
+            site_name = self.site_names[previous & 0xFFFF]
+            counts[site_name] = counts.get(site_name, 0) + 1
+        return counts
+
+class SourceStats:
+    """Per-site yield history across runs, and the scrape plan derived from it.
+
+    Counters decay by SOURCE_STATS_DECAY every run the site is scraped, so rates follow recent behaviour.
+    """
+
+    FIELDS = ("requests", "pages_fetched", "candidates", "unique", "working", "scrape_seconds")
+
+    def __init__(self):
+        self.sites = {}
+
+    def load(self, path=None):
+        """Loads the history saved by earlier runs; returns the number of sites in it."""
+        path = path or SOURCE_STATS_FILE
+        try:
+            with open(path) as f:
+                self.sites = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print(f"Could not read source stats {path}: {e}")
+            return 0
+        return len(self.sites)
+
+    def save(self, path=None):
+        path = path or SOURCE_STATS_FILE
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.sites, f, indent=2)
+        os.replace(temp_path, path)
+
+    def rates(self, site_name):
+        """Fetch success rate, candidates per page, working proxies per request and unique share; None without enough history."""
+        stats = self.sites.get(site_name)
+        if stats is None or stats["runs"] < SOURCE_STATS_MIN_RUNS:
+            return None
+        return {
+            "fetch_success": stats["pages_fetched"] / stats["requests"] if stats["requests"] else 0,
+            "candidates_per_page": stats["candidates"] / stats["pages_fetched"] if stats["pages_fetched"] else 0,
+            "working_per_request": stats["working"] / stats["requests"] if stats["requests"] else 0,
+            "unique_share": stats["unique"] / stats["candidates"] if stats["candidates"] else 0,
         }
-        headers = {'User-Agent': random.choice(USER_AGENTS)}
-        response = session.get(PROXY_TEST_URL, proxies=proxies_dict, timeout=TIMEOUT, headers=headers, verify=False)
-        if response.status_code == 200:
-            return True
-    except requests.exceptions.RequestException:
+
+    def plan(self, targets):
+        """Returns `targets` best yield first, with 'max_pages_to_scrape'/'retry_attempts' budgets from the history.
+
+        Page budgets scale the configured pages by the site's working-per-request over the median of the
+        producing sites. Sites on probation are left out until their re-probe run, which gets 1 page and 1 attempt.
+        """
+        yields = sorted(rates["working_per_request"] for site_name in targets
+                        if (rates := self.rates(site_name)) and rates["working_per_request"] > 0)
+        reference = statistics.median(yields) if yields else None
+        planned = []
+        skipped = blocked = 0
+        for site_name, config in targets.items():
+            stats = self.sites.get(site_name)
+            rates = self.rates(site_name)
+            budget = dict(config)
+            priority = reference or 0 # Sites without history are tried like an average producer
+            if rates is not None and stats["barren_streak"] >= SOURCE_BARREN_RUNS:
+                if stats["skipped_runs"] + 1 < SOURCE_REPROBE_EVERY:
+                    skipped += 1
+                    continue
+                budget["max_pages_to_scrape"] = 1
+                budget["retry_attempts"] = 1
+                priority = -1 # Re-probes go last
+            elif rates is not None:
+                priority = rates["working_per_request"]
+                if reference:
+                    pages = round(config.get("max_pages_to_scrape", MAX_SCRAPING_PAGES) * priority / reference)
+                    budget["max_pages_to_scrape"] = max(1, min(SOURCE_MAX_PAGES, pages))
+                if rates["fetch_success"] < SOURCE_BLOCKED_RATIO:
+                    budget["retry_attempts"] = 1 # Retrying a 403 or an empty JS shell rarely helps
+                    blocked += 1
+            planned.append((priority, site_name, budget))
+        planned.sort(key=lambda item: item[0], reverse=True) # Stable, so ties keep the configured order
+        pages = sum(budget.get("max_pages_to_scrape", MAX_SCRAPING_PAGES) for _, _, budget in planned)
+        print(f"Source plan: {len(planned)}/{len(targets)} sites, {pages} pages budgeted, "
+              f"{skipped} on probation skipped, {blocked} without retries.")
+        return {site_name: budget for _, site_name, budget in planned}
+
+    def record_run(self, site_metrics, tally, scraped, all_sites, complete=True):
+        """Folds one run into the history; `complete` is False after an early stop, which doesn't count as barren."""
+        unique = tally.unique()
+        working = tally.working()
+        now = time.time()
+        for site_name in all_sites:
+            stats = self.sites.setdefault(site_name, {"runs": 0, **dict.fromkeys(self.FIELDS, 0.0),
+                                                      "barren_streak": 0, "skipped_runs": 0, "last_scraped": None})
+            if site_name not in scraped:
+                stats["skipped_runs"] += 1
+                continue
+            metrics = site_metrics.get(site_name) or dict.fromkeys(RunMetrics.SITE_FIELDS, 0)
+            run = {
+                "requests": metrics["pages_fetched"] + metrics["retries"] + metrics["fetch_failures"],
+                "pages_fetched": metrics["pages_fetched"],
+                "candidates": metrics["proxies_yielded"],
+                "unique": unique.get(site_name, 0),
+                "working": round(working.get(site_name, 0), 3),
+                "scrape_seconds": round(metrics["fetch_seconds"] + metrics["parse_seconds"], 3),
+            }
+            for field in self.FIELDS:
+                stats[field] = stats[field] * SOURCE_STATS_DECAY + run[field]
+            stats["runs"] += 1
+            stats["skipped_runs"] = 0
+            stats["last_scraped"] = now
+            stats["last_run"] = run
+            if run["working"]:
+                stats["barren_streak"] = 0
+            elif complete:
+                stats["barren_streak"] += 1
+
+source_stats = SourceStats()
+
+# --- Proxy Probing ---
+# Ek probe = proxy se TCP connect, phir PROXY_TEST_URL ki request aur response ka pehla line.
+# Handshake ek generator mein hai taaki thread wala (blocking) aur asyncio driver dono wahi steps chalayein.
+# Har proxy par PROBES_PER_PROXY probes chalte hain; median latency aur success ratio se score banta hai.
+
+probe_tls_context = ssl.create_default_context()
+probe_tls_context.check_hostname = False
+probe_tls_context.verify_mode = ssl.CERT_NONE # Same as verify=False, we only care that the proxy relays TLS
+
+probe_host_addresses = {} # Test host -> packed IPv4 for SOCKS4 requests, b"" if it didn't resolve
+
+HTTP_REDIRECT_CODES = (b"301", b"302", b"303", b"307", b"308")
+
+def is_http_redirect(status_line):
+    return status_line.split(b" ", 2)[1:2] in [[code] for code in HTTP_REDIRECT_CODES]
+
+def is_http_ok(status_line, redirect_ok=False):
+    """200, or with `redirect_ok` also a redirect (for answers that can only have come from the origin)."""
+    return status_line.split(b" ", 2)[1:2] == [b"200"] or (redirect_ok and is_http_redirect(status_line))
+
+def probe_target():
+    """Returns (host, port, host_header, use_tls, path) for fetching PROXY_TEST_URL."""
+    parsed = urlparse(PROXY_TEST_URL)
+    use_tls = parsed.scheme == "https"
+    return parsed.hostname, parsed.port or (443 if use_tls else 80), parsed.netloc, use_tls, parsed.path or "/"
+
+def probe_host_address(host):
+    """IPv4 of the test host for SOCKS4 (resolved once per run); None means fall back to SOCKS4a."""
+    if host not in probe_host_addresses:
+        try:
+            probe_host_addresses[host] = socket.inet_aton(socket.gethostbyname(host))
+        except (OSError, UnicodeError):
+            probe_host_addresses[host] = b""
+    return probe_host_addresses[host] or None
+
+def read_exactly(size, sniff=False):
+    """Probe sub-steps: reads `size` bytes, None if the peer closes first.
+
+    With `sniff`, the first read gives up after PROBE_SNIFF_TIMEOUT (the driver answers None), for
+    handshakes a proxy of another protocol may silently ignore.
+    """
+    data = b""
+    while len(data) < size:
+        chunk = yield ("sniff" if sniff and not data else "read"), size - len(data)
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def read_status_line():
+    """Probe sub-steps: reads an HTTP status line, None if the peer closes or answers with non-HTTP bytes."""
+    head = b""
+    while len(head) < 5:
+        chunk = yield "read", 5 - len(head)
+        if not chunk or not b"HTTP/".startswith(head + chunk):
+            return None # A SOCKS server's binary reply, or a hang-up
+        head += chunk
+    return head + (yield "readline", None)
+
+def request_steps(target, host_header):
+    """Probe sub-steps: sends the test GET and returns its status line (None if not HTTP), marking time-to-first-byte."""
+    yield "write", (f"GET {target} HTTP/1.1\r\nHost: {host_header}\r\nUser-Agent: {random.choice(USER_AGENTS)}\r\n"
+                    f"Accept: */*\r\nConnection: close\r\n\r\n").encode()
+    status_line = yield from read_status_line()
+    yield "first_byte", None
+    return status_line
+
+def tunneled_request_steps():
+    """Probe sub-steps: fetches PROXY_TEST_URL through an established tunnel (TLS inside it for https).
+
+    A tunnel only relays the origin's bytes, so a redirect from the test URL counts as success too.
+    """
+    host, _, host_header, use_tls, path = probe_target()
+    if use_tls:
+        yield "start_tls", host
+    status_line = yield from request_steps(path, host_header)
+    return status_line is not None and is_http_ok(status_line, redirect_ok=True)
+
+def redirect_location_steps():
+    """Probe sub-steps: reads response headers and returns the http:// URL a redirect points to, or None."""
+    location = None
+    while (line := (yield "readline", None)) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"location":
+            location = urljoin(PROXY_TEST_URL, value.strip().decode("latin-1"))
+    return location if location and urlparse(location).scheme == "http" else None
+
+def http_handshake():
+    """HTTP proxy: plain GET for an http test URL, CONNECT tunnel for https. Returns (protocol, ok) or None.
+
+    The proxy itself may answer the GET, so a redirect isn't taken as success: one http:// redirect is
+    followed on a fresh connection and that answer has to be a 200.
+    """
+    _, _, host_header, use_tls, _ = probe_target()
+    if use_tls:
+        return (yield from connect_handshake())
+    status_line = yield from request_steps(PROXY_TEST_URL if urlparse(PROXY_TEST_URL).path else PROXY_TEST_URL + "/", host_header)
+    if status_line is None:
+        return None
+    if is_http_redirect(status_line):
+        location = yield from redirect_location_steps()
+        if location is None:
+            return "http", False # Redirected somewhere a plain GET through the proxy can't follow
+        yield "reconnect", None
+        status_line = yield from request_steps(location, urlparse(location).netloc)
+        return "http", status_line is not None and is_http_ok(status_line)
+    return "http", is_http_ok(status_line)
+
+def connect_handshake():
+    """HTTPS proxy: CONNECT tunnel to the test host (TLS inside it for an https test URL). Returns (protocol, ok) or None."""
+    host, port, _, _, _ = probe_target()
+    yield "write", f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode()
+    status_line = yield from read_status_line()
+    if status_line is None:
+        return None
+    if not is_http_ok(status_line):
+        return "http", False # An HTTP proxy, but it won't tunnel
+    while (yield "readline", None) not in (b"\r\n", b"\n", b""):
         pass
-    except Exception as e:
-        # print(f"An unexpected error occurred while testing proxy {proxy}: {e}")
+    return "https", (yield from tunneled_request_steps())
+
+def socks5_handshake():
+    """SOCKS5 without authentication, test host sent as a domain name. Returns (protocol, ok) or None."""
+    host, port, _, _, _ = probe_target()
+    yield "write", b"\x05\x01\x00" # Version 5, one auth method: none
+    reply = yield from read_exactly(2, sniff=True)
+    if reply is None or reply[0] != 5:
+        return None
+    if reply[1] != 0:
+        return "socks5", False # Wants a username/password
+    yield "write", b"\x05\x01\x00\x03" + bytes([len(host)]) + host.encode() + struct.pack("!H", port)
+    reply = yield from read_exactly(4)
+    if reply is None or reply[1] != 0:
+        return "socks5", False
+    if reply[3] == 3: # Bound address is a domain name, length-prefixed
+        length = yield from read_exactly(1)
+        address_size = length[0] if length else None
+    else:
+        address_size = {1: 4, 4: 16}.get(reply[3])
+    if address_size is None or (yield from read_exactly(address_size + 2)) is None:
+        return "socks5", False
+    return "socks5", (yield from tunneled_request_steps())
+
+def socks4_handshake():
+    """SOCKS4 CONNECT (SOCKS4a if the test host didn't resolve locally). Returns (protocol, ok) or None."""
+    host, port, _, _, _ = probe_target()
+    address = probe_host_address(host)
+    if address is None:
+        request = b"\x04\x01" + struct.pack("!H", port) + b"\x00\x00\x00\x01\x00" + host.encode() + b"\x00"
+    else:
+        request = b"\x04\x01" + struct.pack("!H", port) + address + b"\x00"
+    yield "write", request
+    reply = yield from read_exactly(8, sniff=True)
+    if reply is None or reply[0] != 0:
+        return None
+    if reply[1] != 0x5A:
+        return "socks4", False # Request rejected
+    return "socks4", (yield from tunneled_request_steps())
+
+PROBE_HANDSHAKES = {"http": http_handshake, "https": connect_handshake, "socks5": socks5_handshake, "socks4": socks4_handshake}
+
+def probe_order(protocol_hint=None, fallback=True):
+    """Handshakes to try: hinted protocol family first, then (with `fallback`) the rest of PROBE_PROTOCOL_ORDER.
+
+    An "https" hint probes CONNECT explicitly; without it an http test URL is only ever fetched with a plain GET.
+    """
+    https = ["http"] if probe_target()[3] else ["https"] # For an https test URL the http handshake already CONNECTs
+    hinted = {"https": https, "socks": ["socks5", "socks4"]}.get(protocol_hint, [protocol_hint] if protocol_hint else [])
+    if hinted and not fallback:
+        return hinted
+    return hinted + [family for family in PROBE_PROTOCOL_ORDER if family not in hinted]
+
+def sniff_probe_steps(protocol_hint=None, fallback=True):
+    """Generator for one probe: tries each protocol's handshake until one is recognised, returns (protocol, ok).
+
+    Steps yielded to the driver: ("write", bytes); ("read", n) and ("sniff", n) for up to n bytes (sniff gives
+    up after PROBE_SNIFF_TIMEOUT and returns b""); ("readline", None); ("start_tls", server_hostname);
+    ("first_byte", None) to mark time-to-first-byte; and ("reconnect", None) when a handshake was not
+    recognised and the next one needs a fresh connection. The driver sends read results back in (None for
+    a sniff that got silence). A recognised protocol ends the probe even if the request through it failed.
+
+    A proxy that hung up on the HTTP request without a byte is either a SOCKS server rejecting it or an
+    HTTP proxy dropping it; the first SOCKS sniff it then stays silent on settles it as a failed HTTP proxy.
+    """
+    http_hung_up = False
+    for index, family in enumerate(probe_order(protocol_hint, fallback)):
+        if index:
+            yield "reconnect", None
+        handshake = PROBE_HANDSHAKES[family]()
+        reply = None
+        answered = silent = False
+        try:
+            while True:
+                step = handshake.send(reply)
+                reply = yield step
+                answered = answered or bool(reply)
+                silent = silent or (step[0] == "sniff" and reply is None)
+        except StopIteration as done:
+            outcome = done.value
+        if outcome is not None:
+            return outcome
+        if silent and http_hung_up:
+            return "http", False
+        http_hung_up = http_hung_up or (family == "http" and not answered)
+    return None, False
+
+class ProbeCancelled(Exception):
+    """A blocking probe was abandoned because its ProbeStop was set."""
+
+class ProbeStop:
+    """Cancels blocking probes from another thread (the thread engine's early stop).
+
+    Probes check it between steps and between repeated probes; a socket blocked in connect() or a
+    read is woken by shutting it down, so no probe outlives the stop by more than a moment.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.sockets = set()
+
+    def set(self):
+        with self.lock: # Held while shutting down, so a probe can't close and reuse the fd meanwhile
+            self.event.set()
+            for sock in self.sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def check(self):
+        if self.event.is_set():
+            raise ProbeCancelled()
+
+    def register(self, sock):
+        with self.lock:
+            self.check()
+            self.sockets.add(sock)
+
+    def unregister(self, sock):
+        with self.lock:
+            self.sockets.discard(sock)
+
+def run_probe_blocking(proxy, steps, timeout=None, stop=None):
+    """Drives probe steps over a blocking socket; returns (ok, connect_seconds, ttfb_seconds, protocol).
+
+    Timings are for the last connection, the one the detected protocol was used on. With a ProbeStop
+    the probe raises ProbeCancelled once it is set.
+    """
+    timeout = timeout or TIMEOUT
+    host, port = proxy.rsplit(":", 1)
+    deadline = time.perf_counter() + timeout
+    sock = reader = None
+    ttfb_seconds = None
+
+    def close():
+        if stop is not None:
+            stop.unregister(sock)
+        reader.close()
+        sock.close()
+
+    try:
+        reply = action = None
+        while True:
+            if stop is not None:
+                stop.check()
+            if sock is None or action == "reconnect":
+                if sock is not None:
+                    close()
+                    sock = None
+                connected_at = time.perf_counter()
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Candidates are IPv4 (pack_candidate)
+                reader = sock.makefile("rb")
+                if stop is not None:
+                    stop.register(sock)
+                sock.settimeout(max(0.01, deadline - connected_at))
+                sock.connect((host, int(port)))
+                started = connected_at
+                connect_seconds = time.perf_counter() - started
+            try:
+                action, argument = steps.send(reply)
+            except StopIteration as done:
+                protocol, ok = done.value
+                return ok, connect_seconds, ttfb_seconds, protocol
+            reply = None
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise socket.timeout("probe deadline reached")
+            sock.settimeout(remaining) # One deadline for the whole probe, not per read
+            try:
+                if action == "write":
+                    sock.sendall(argument)
+                elif action == "start_tls":
+                    reader.close()
+                    plain = sock
+                    sock = probe_tls_context.wrap_socket(sock, server_hostname=argument)
+                    reader = sock.makefile("rb")
+                    if stop is not None:
+                        stop.unregister(plain)
+                        stop.register(sock)
+                elif action == "read":
+                    reply = reader.read1(argument)
+                elif action == "sniff":
+                    sock.settimeout(min(remaining, PROBE_SNIFF_TIMEOUT))
+                    try:
+                        reply = reader.read1(argument)
+                    except socket.timeout:
+                        reply = None # Silence: not this protocol
+                elif action == "readline":
+                    reply = reader.readline(65536)
+                elif action == "first_byte":
+                    ttfb_seconds = time.perf_counter() - started
+            except (ConnectionResetError, BrokenPipeError):
+                reply = b"" # Peer hung up on a handshake it didn't understand
+    finally:
+        if sock is not None:
+            close()
+
+class AdaptiveTimeout:
+    """Probe timeout learned from the durations of recent successful probes: a high percentile plus a margin, capped at TIMEOUT.
+
+    Slow proxies that time out are never observed, so the timeout keeps tightening until the percentile
+    of the survivors plus the margin settles.
+    """
+
+    def __init__(self, window=ADAPTIVE_TIMEOUT_WINDOW):
+        self.lock = threading.Lock()
+        self.window = window
+        self.recent = deque() # Arrival order, for evicting the oldest sample
+        self.ordered = [] # Same samples, sorted, for the percentile
+
+    def observe(self, seconds):
+        with self.lock:
+            self.recent.append(seconds)
+            bisect.insort(self.ordered, seconds)
+            if len(self.recent) > self.window:
+                del self.ordered[bisect.bisect_left(self.ordered, self.recent.popleft())]
+
+    def current(self):
+        if not ADAPTIVE_TIMEOUT:
+            return TIMEOUT
+        with self.lock:
+            if len(self.ordered) < ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+                return TIMEOUT
+            index = min(len(self.ordered) - 1, len(self.ordered) * ADAPTIVE_TIMEOUT_PERCENTILE // 100)
+            learned = self.ordered[index] + ADAPTIVE_TIMEOUT_MARGIN
+        return min(TIMEOUT, max(ADAPTIVE_TIMEOUT_FLOOR, learned))
+
+probe_timeout = AdaptiveTimeout()
+
+def probe_deadline(protocol_hint=None, fallback=True):
+    """Deadline for one whole probe: the learned timeout, but never less than the silent sniffs the handshake order may sit through."""
+    sniffs = sum(family in ("socks5", "socks4") for family in probe_order(protocol_hint, fallback)[:-1])
+    return min(TIMEOUT, max(probe_timeout.current(), sniffs * PROBE_SNIFF_TIMEOUT + ADAPTIVE_TIMEOUT_FLOOR))
+
+def test_proxy(proxy, protocol_hint=None, fallback=True, stop=None):
+    """Runs one probe through the proxy; returns (ok, connect_seconds, ttfb_seconds, protocol).
+
+    Timings are None on failure, protocol is None if no handshake was recognised. Without `fallback`
+    only the hinted protocol is tried. Raises ProbeCancelled if `stop` (a ProbeStop) was set meanwhile.
+    """
+    started = time.perf_counter()
+    result = (False, None, None, None)
+    timed_out = False
+    try:
+        result = run_probe_blocking(proxy, sniff_probe_steps(protocol_hint, fallback), probe_deadline(protocol_hint, fallback), stop)
+        if result[0]:
+            probe_timeout.observe(time.perf_counter() - started) # The whole probe, sniffs included, is what the deadline covers
+    except ProbeCancelled:
+        raise
+    except socket.timeout:
+        timed_out = True
+    except (OSError, ValueError):
         pass
-    return False
+    except Exception as e: # Expected failures are caught above; anything else is worth seeing
+        print(f"An unexpected error occurred while testing proxy {proxy}: {e!r}")
+    if stop is not None:
+        stop.check() # A probe cut short by the stop says nothing about the proxy
+    run_metrics.observe("http-probe", result[0], time.perf_counter() - started, timed_out)
+    return result
 
-def check_dnsbl(ip):
-    """Checks an IP against free DNSBL servers using socket."""
-    dnsbl_listings = 0
+def proxy_score(ttfb_seconds, success_ratio):
+    """Lower is better: median time-to-first-byte, inflated by the share of probes that failed."""
+    return ttfb_seconds / success_ratio
+
+def summarize_probes(probes):
+    """Turns a list of (ok, connect_seconds, ttfb_seconds, protocol) probes into the stats kept for each proxy."""
+    passed = [probe for probe in probes if probe[0]]
+    success_ratio = len(passed) / len(probes)
+    stats = {
+        "protocol": next((probe[3] for probe in passed or probes if probe[3]), None),
+        "probes": len(probes),
+        "success_ratio": round(success_ratio, 3),
+        "connect_ms": None,
+        "ttfb_ms": None,
+        "score": None,
+        "last_checked": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    if passed:
+        ttfb_seconds = statistics.median(probe[2] for probe in passed)
+        stats["connect_ms"] = round(statistics.median(probe[1] for probe in passed) * 1000, 1)
+        stats["ttfb_ms"] = round(ttfb_seconds * 1000, 1)
+        stats["score"] = round(proxy_score(ttfb_seconds, success_ratio), 4)
+    return stats
+
+def probe_proxy(proxy, protocol_hint=None, probes=None, stop=None):
+    """Probes a proxy up to `probes` times and returns summarize_probes() stats.
+
+    A proxy that fails its first probe is not probed again: most candidates are simply dead.
+    Later probes only speak the protocol the first one detected. Raises ProbeCancelled once `stop` is set.
+    """
+    probes = probes or PROBES_PER_PROXY
+    results = [test_proxy(proxy, protocol_hint, stop=stop)]
+    while results[0][0] and len(results) < probes:
+        results.append(test_proxy(proxy, results[0][3], fallback=False, stop=stop))
+    return summarize_probes(results)
+
+def probe_passed(stats):
+    return stats["success_ratio"] > 0 and stats["success_ratio"] >= PROBE_MIN_SUCCESS_RATIO
+
+FD_EXHAUSTED = {errno.EMFILE, errno.ENFILE} # Out of file descriptors: says nothing about the proxy
+
+def tcp_prefilter(proxies, timeout=None, batch_size=None, failed=None):
+    """Returns the proxies (in input order) whose ip:port accepts a TCP connection, using non-blocking connect().
+
+    Running out of file descriptors is not a failed connect: the batch stops growing, the in-flight
+    sockets drain and the candidate is tried again, so only attempted connects count as unreachable.
+    If `failed` is a list, proxies whose connect was attempted and refused or timed out are appended to it.
+    """
+    timeout = timeout or TCP_PREFILTER_TIMEOUT
+    batch_size = raise_open_file_limit(batch_size or TCP_PREFILTER_BATCH)
+    reachable = []
+    pending = iter(proxies)
+    retry = None # Candidate whose socket could not be created for lack of file descriptors
+    fd_wait = 0.05
+    selector = selectors.DefaultSelector()
+    in_flight = {} # socket -> (proxy, started)
+    deadlines = deque() # (deadline, socket), deadlines are monotonic because timeout is fixed
+    in_progress = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, "WSAEWOULDBLOCK", errno.EWOULDBLOCK)}
+
+    def finish(sock):
+        selector.unregister(sock)
+        del in_flight[sock]
+        sock.close()
+
+    try:
+        while True:
+            while len(in_flight) < batch_size:
+                proxy, retry = retry or next(pending, None), None
+                if proxy is None:
+                    break
+                sock = None
+                try:
+                    host, port = proxy.rsplit(":", 1)
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.setblocking(False)
+                    result = sock.connect_ex((host, int(port)))
+                except (OSError, ValueError, OverflowError) as e:
+                    if sock is not None:
+                        sock.close()
+                    if getattr(e, "errno", None) in FD_EXHAUSTED:
+                        retry = proxy # Try again once sockets (ours or another thread's) are closed
+                        break
+                    continue
+                fd_wait = 0.05
+                if result in FD_EXHAUSTED:
+                    sock.close()
+                    retry = proxy
+                    break
+                if result == 0:
+                    reachable.append(proxy)
+                    run_metrics.observe("tcp-prefilter", True, 0)
+                    sock.close()
+                elif result in in_progress:
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    started = time.monotonic()
+                    in_flight[sock] = (proxy, started)
+                    deadlines.append((started + timeout, sock))
+                else:
+                    run_metrics.observe("tcp-prefilter", False, 0)
+                    sock.close() # Refused / unreachable straight away
+                    if failed is not None:
+                        failed.append(proxy)
+
+            if not in_flight:
+                if retry is None:
+                    break
+                time.sleep(fd_wait) # Every descriptor is held elsewhere; wait for other threads to release some
+                fd_wait = min(fd_wait * 2, 1)
+                continue
+
+            while deadlines and deadlines[0][1] not in in_flight:
+                deadlines.popleft() # Already finished
+            wait = max(0, deadlines[0][0] - time.monotonic()) if deadlines else timeout
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                proxy, started = in_flight[sock]
+                connected = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                if connected:
+                    reachable.append(proxy)
+                elif failed is not None:
+                    failed.append(proxy)
+                run_metrics.observe("tcp-prefilter", connected, time.monotonic() - started)
+                finish(sock)
+
+            now = time.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                _, sock = deadlines.popleft()
+                if sock in in_flight:
+                    run_metrics.observe("tcp-prefilter", False, timeout, timed_out=True)
+                    if failed is not None:
+                        failed.append(in_flight[sock][0])
+                    finish(sock) # Timed out, treat as blackholed
+    finally:
+        for sock in list(in_flight):
+            finish(sock)
+        selector.close()
+    reachable = set(reachable)
+    return [proxy for proxy in proxies if proxy in reachable]
+
+# --- DNSBL Resolver ---
+# Saare DNSBL zones ek saath query hote hain (ek UDP socket, selectors se multiplex),
+# answers ka TTL cache mein rakha jata hai aur cache file runs ke beech save hoti hai.
+
+def read_system_nameserver():
+    """Returns the first nameserver from /etc/resolv.conf as (ip, 53), or None if there isn't one."""
     try:
+        with open("/etc/resolv.conf") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver" and ":" not in parts[1]:
+                    return parts[1], 53
+    except OSError:
+        pass
+    return None
+
+def build_dns_query(query_id, name):
+    """Builds a recursive DNS query packet for the A record of `name`."""
+    question = b"".join(bytes([len(label)]) + label.encode("ascii") for label in name.rstrip(".").split("."))
+    return struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + question + b"\x00" + struct.pack("!HH", 1, 1)
+
+def skip_dns_name(packet, offset):
+    """Returns the offset just past the (possibly compressed) domain name starting at `offset`."""
+    while True:
+        length = packet[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0: # Compression pointer, name ends here
+            return offset + 2
+        offset += length + 1
+
+def parse_dns_response(packet):
+    """Parses a DNS response into (query_id, addresses, ttl); addresses is empty for NXDOMAIN/NODATA."""
+    query_id, flags, qdcount, ancount, nscount, _ = struct.unpack_from("!HHHHHH", packet)
+    rcode = flags & 0x000F
+    if rcode not in (0, 3): # Only NOERROR and NXDOMAIN are real answers
+        raise ValueError(f"DNS server returned rcode {rcode}")
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_dns_name(packet, offset) + 4
+    addresses = []
+    ttl = None
+    for index in range(ancount + nscount):
+        offset = skip_dns_name(packet, offset)
+        rtype, _, record_ttl, rdlength = struct.unpack_from("!HHIH", packet, offset)
+        offset += 10
+        rdata_start = offset
+        offset += rdlength
+        if index < ancount:
+            if rtype == 1 and rdlength == 4:
+                addresses.append(socket.inet_ntoa(packet[rdata_start:offset]))
+                ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+        elif rtype == 6 and not addresses: # SOA in authority section: negative-caching TTL (RFC 2308)
+            soa_end = skip_dns_name(packet, skip_dns_name(packet, rdata_start))
+            minimum = struct.unpack_from("!IIIII", packet, soa_end)[4]
+            ttl = min(record_ttl, minimum)
+    return query_id, addresses, ttl
+
+def is_dnsbl_listing(address):
+    """True if a DNSBL answer means 'listed' (127.0.0.0/8 except Spamhaus' 127.255.255.x error codes)."""
+    return address.startswith("127.") and not address.startswith("127.255.255.")
+
+class DnsblResolver:
+    """Parallel DNSBL lookups with a TTL-aware, size-bounded per-IP cache that can be saved to disk."""
+
+    def __init__(self, zones=None, nameserver=None, timeout=None, max_inflight=None, max_entries=None):
+        self.zones = list(zones if zones is not None else FREE_DNSBL_SERVERS)
+        self.nameserver = nameserver or DNSBL_NAMESERVER or read_system_nameserver()
+        self.timeout = timeout if timeout is not None else DNSBL_QUERY_TIMEOUT
+        self.max_entries = max_entries if max_entries is not None else DNSBL_CACHE_MAX_ENTRIES
+        self.inflight_limit = threading.BoundedSemaphore(max_inflight or DNSBL_MAX_INFLIGHT)
+        self.cache = OrderedDict() # ip -> (listings, expires_at epoch seconds), oldest first
+        self.pending = {} # ip -> threading.Event for lookups already running in another thread
+        self.new_entries = None # ip -> (listings, expires_at) looked up since take_new_entries(); tracked by workers only
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, ip, stop_on_listing=True):
+        """Returns the number of zones listing `ip`, from cache when fresh; stops at the first listing if asked."""
+        while True:
+            with self.lock:
+                entry = self.cache.get(ip)
+                if entry is not None and entry[1] > time.time():
+                    self.cache.move_to_end(ip)
+                    self.hits += 1
+                    return entry[0]
+                waiter = self.pending.get(ip)
+                if waiter is None:
+                    # Same IP with different ports is common, only one thread does the lookup
+                    self.pending[ip] = threading.Event()
+                    self.misses += 1
+                    break
+            waiter.wait()
+            with self.lock:
+                if ip in self.cache:
+                    continue
+            return 0 # The other lookup failed and cached nothing
+        try:
+            with self.inflight_limit:
+                started = time.perf_counter()
+                listings, ttl = self.lookup(ip, stop_on_listing)
+            # Uncacheable means some zone never answered (or the socket failed)
+            run_metrics.observe("dnsbl", ttl is not None, time.perf_counter() - started, timed_out=ttl is None)
+            if ttl is not None:
+                self.store(ip, listings, ttl)
+            return listings
+        finally:
+            with self.lock:
+                self.pending.pop(ip).set()
+
+    def lookup(self, ip, stop_on_listing):
+        """Queries every zone at once; returns (listings, ttl), ttl is None if the result must not be cached."""
+        if self.nameserver is None:
+            return self.lookup_with_system_resolver(ip, stop_on_listing)
         reversed_ip = ".".join(ip.split('.')[::-1])
-        for dnsbl in FREE_DNSBL_SERVERS:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        selector = selectors.DefaultSelector()
+        try:
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+            outstanding = {} # query id -> zone
+            base_id = random.randrange(0, 0x10000)
+            for index, zone in enumerate(self.zones):
+                query_id = (base_id + index) & 0xFFFF
+                outstanding[query_id] = zone
+                sock.sendto(build_dns_query(query_id, f"{reversed_ip}.{zone}"), self.nameserver)
+
+            listings = 0
+            ttl = None
+            deadline = time.monotonic() + self.timeout
+            while outstanding:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    print(f"DNSBL lookup for {ip} timed out on: {', '.join(outstanding.values())}")
+                    return listings, (ttl if listings else None) # A listing is still trustworthy
+                try:
+                    packet, source = sock.recvfrom(4096)
+                    query_id, addresses, answer_ttl = parse_dns_response(packet)
+                except (OSError, ValueError, struct.error, IndexError) as e:
+                    print(f"Error during DNSBL check for {ip}: {e}")
+                    continue
+                if source[0] != self.nameserver[0] or query_id not in outstanding:
+                    continue # Stray or spoofed packet
+                zone = outstanding.pop(query_id)
+                answer_ttl = DNSBL_DEFAULT_TTL if answer_ttl is None else answer_ttl
+                ttl = answer_ttl if ttl is None else min(ttl, answer_ttl)
+                if any(is_dnsbl_listing(address) for address in addresses):
+                    listings += 1
+                    if stop_on_listing:
+                        break # Caller rejects on any listing, the other zones don't matter
+            return listings, ttl
+        except OSError as e:
+            print(f"Error preparing DNSBL check for {ip}: {e}")
+            return 0, None
+        finally:
+            selector.close()
+            sock.close()
+
+    def lookup_with_system_resolver(self, ip, stop_on_listing):
+        """Fallback for hosts without a readable resolv.conf: blocking lookups, cached for the default TTL."""
+        reversed_ip = ".".join(ip.split('.')[::-1])
+        listings = 0
+        for dnsbl in self.zones:
             try:
-                socket.gethostbyname(f"{reversed_ip}.{dnsbl}")
-                dnsbl_listings += 1
+                if is_dnsbl_listing(socket.gethostbyname(f"{reversed_ip}.{dnsbl}")):
+                    listings += 1
+                    if stop_on_listing:
+                        break
             except socket.gaierror:
                 pass # Not listed
             except Exception as e:
                 print(f"Error during DNSBL check for {ip} on {dnsbl}: {e}")
-    except Exception as e:
-        print(f"Error preparing DNSBL check for {ip}: {e}")
-    return dnsbl_listings
-
-def test_and_check_proxy(proxy):
-    """Combines proxy testing and DNSBL checking."""
-    session = requests.Session() # New session for each proxy test
-    is_working = test_proxy(session, proxy)
+                return listings, None
+        return listings, DNSBL_DEFAULT_TTL
+
+    def store(self, ip, listings, ttl):
+        """Caches a result, clamping the TTL to the configured bounds and evicting if the cache is full."""
+        ttl = min(max(ttl, DNSBL_MIN_CACHE_TTL), DNSBL_MAX_CACHE_TTL)
+        with self.lock:
+            self.cache[ip] = (listings, time.time() + ttl)
+            self.cache.move_to_end(ip)
+            if self.new_entries is not None:
+                self.new_entries[ip] = self.cache[ip]
+            if len(self.cache) > self.max_entries:
+                self.evict()
+
+    def take_new_entries(self):
+        """Entries looked up since the last call, as JSON-friendly {ip: [listings, expires_at]}; starts tracking on first use."""
+        with self.lock:
+            entries, self.new_entries = self.new_entries or {}, {}
+        return {ip: list(entry) for ip, entry in entries.items()}
+
+    def merge(self, entries):
+        """Adds entries another process looked up, keeping whichever result for an IP expires last."""
+        now = time.time()
+        with self.lock:
+            for ip, (listings, expires_at) in entries.items():
+                current = self.cache.get(ip)
+                if expires_at > now and (current is None or current[1] < expires_at):
+                    self.cache[ip] = (listings, expires_at)
+                    self.cache.move_to_end(ip)
+            if len(self.cache) > self.max_entries:
+                self.evict()
+
+    def evict(self):
+        """Drops expired entries first, then least recently used ones, until the cache fits. Caller holds the lock."""
+        now = time.time()
+        for ip in [ip for ip, (_, expires_at) in self.cache.items() if expires_at <= now]:
+            del self.cache[ip]
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def load(self, path=None):
+        """Loads unexpired cache entries saved by a previous run."""
+        path = path or DNSBL_CACHE_FILE
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print(f"Could not read DNSBL cache {path}: {e}")
+            return 0
+        now = time.time()
+        with self.lock:
+            for ip, (listings, expires_at) in sorted(saved.items(), key=lambda item: item[1][1]):
+                if expires_at > now:
+                    self.cache[ip] = (listings, expires_at)
+            if len(self.cache) > self.max_entries:
+                self.evict()
+            return len(self.cache)
+
+    def save(self, path=None):
+        """Writes unexpired cache entries to disk for the next run."""
+        path = path or DNSBL_CACHE_FILE
+        now = time.time()
+        with self.lock:
+            snapshot = {ip: [listings, expires_at] for ip, (listings, expires_at) in self.cache.items() if expires_at > now}
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temp_path, path)
+
+dnsbl_resolver = DnsblResolver()
+
+def check_dnsbl(ip):
+    """Checks an IP against free DNSBL servers (all zones in parallel, cached per IP)."""
+    return dnsbl_resolver.check(ip)
+
+def test_and_check_proxy(proxy, protocol_hint=None, stop=None):
+    """Combines proxy probing and DNSBL checking; returns (is_working, dnsbl_listings, proxy, probe stats).
+
+    Once `stop` (a ProbeStop) is set it raises ProbeCancelled instead, before touching the health store or DNSBL cache.
+    """
+    stats = probe_proxy(proxy, protocol_hint, stop=stop)
+    if stop is not None:
+        stop.check()
+    is_working = probe_passed(stats)
+    if health_store is not None:
+        health_store.record(proxy, is_working, None if stats["ttfb_ms"] is None else stats["ttfb_ms"] / 1000,
+                            protocol=stats["protocol"])
     ip = proxy.split(":")[0]
     dnsbl_listings = 0
     if is_working:
         dnsbl_listings = check_dnsbl(ip)
-    session.close() # Close the session
-    return is_working, dnsbl_listings, proxy
+    return is_working, dnsbl_listings, proxy, stats
 
-def process_scraped_proxies():
-    """Main function to scrape, test, and save proxies."""
-    all_scraped_proxies = []
+# --- Async Validation Engine ---
+# Har proxy ke liye OS thread ki jagah ek coroutine; sockets non-blocking hain isliye
+# ek hi process mein hazaaron probes in flight reh sakte hain.
 
-    print("Starting proxy scraping from configured websites...")
-    with ThreadPoolExecutor(max_workers=SCRAPING_CONCURRENCY) as executor:
-        scrape_futures = {executor.submit(scrape_website_pages, site_name, config): site_name
-                          for site_name, config in SCRAPING_TARGETS.items()
-                          if all(k in config for k in ["ip_port_selector", "ip_index", "port_index"])}
+def raise_open_file_limit(wanted):
+    """Raises the soft open-file limit towards `wanted` and returns how many sockets we can safely use."""
+    try:
+        import resource
+    except ImportError: # Windows has no RLIMIT_NOFILE
+        return wanted
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = wanted + 64 # Headroom for log files, DNS sockets, etc.
+    if hard != resource.RLIM_INFINITY:
+        target = min(target, hard)
+    if target > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return max(1, min(wanted, soft - 64))
 
-        for future in as_completed(scrape_futures):
-            site_name = scrape_futures[future]
+async def run_probe_async(proxy, steps):
+    """Async driver for probe steps over asyncio streams; same (ok, connect_seconds, ttfb_seconds, protocol) result."""
+    host, port = proxy.rsplit(":", 1)
+    writer = None
+    ttfb_seconds = None
+    try:
+        reply = action = None
+        while True:
+            if writer is None or action == "reconnect":
+                if writer is not None:
+                    writer.close()
+                started = time.perf_counter()
+                reader, writer = await asyncio.open_connection(host, int(port))
+                connect_seconds = time.perf_counter() - started
             try:
-                proxies = future.result()
-                all_scraped_proxies.extend(proxies)
-            except Exception as exc:
-                print(f'[{site_name}] Scraping generated an exception: {exc}')
+                action, argument = steps.send(reply)
+            except StopIteration as done:
+                protocol, ok = done.value
+                return ok, connect_seconds, ttfb_seconds, protocol
+            reply = None
+            try:
+                if action == "write":
+                    writer.write(argument)
+                    await writer.drain()
+                elif action == "start_tls":
+                    await writer.start_tls(probe_tls_context, server_hostname=argument)
+                elif action == "read":
+                    reply = await reader.read(argument)
+                elif action == "sniff":
+                    try:
+                        reply = await asyncio.wait_for(reader.read(argument), PROBE_SNIFF_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        reply = None # Silence: not this protocol
+                elif action == "readline":
+                    reply = await reader.readline()
+                elif action == "first_byte":
+                    ttfb_seconds = time.perf_counter() - started
+            except (ConnectionResetError, BrokenPipeError):
+                reply = b"" # Peer hung up on a handshake it didn't understand
+    finally:
+        if writer is not None:
+            writer.close()
+
+async def async_test_proxy(proxy, protocol_hint=None, fallback=True):
+    """Async counterpart of test_proxy: same probe steps over a raw stream, same result tuple."""
+    started = time.perf_counter()
+    result = (False, None, None, None)
+    timed_out = False
+    try:
+        result = await asyncio.wait_for(run_probe_async(proxy, sniff_probe_steps(protocol_hint, fallback)),
+                                        probe_deadline(protocol_hint, fallback))
+        if result[0]:
+            probe_timeout.observe(time.perf_counter() - started) # The whole probe, sniffs included, is what the deadline covers
+    except asyncio.TimeoutError:
+        timed_out = True
+    except (OSError, ValueError, ssl.SSLError):
+        pass
+    except Exception as e: # Expected failures are caught above; anything else is worth seeing
+        print(f"An unexpected error occurred while async testing proxy {proxy}: {e!r}")
+    run_metrics.observe("http-probe", result[0], time.perf_counter() - started, timed_out)
+    return result
+
+async def async_probe_proxy(proxy, protocol_hint=None, probes=None):
+    """Async counterpart of probe_proxy."""
+    probes = probes or PROBES_PER_PROXY
+    results = [await async_test_proxy(proxy, protocol_hint)]
+    while results[0][0] and len(results) < probes:
+        results.append(await async_test_proxy(proxy, results[0][3], fallback=False))
+    return summarize_probes(results)
+
+dnsbl_executor = None # Threads for the async engine's DNSBL checks, created on first use
+
+def get_dnsbl_executor():
+    """Executor sized to DNSBL_MAX_INFLIGHT, so DNSBL checks don't queue behind prefilter batches in the loop's default one."""
+    global dnsbl_executor
+    if dnsbl_executor is None:
+        dnsbl_executor = ThreadPoolExecutor(max_workers=DNSBL_MAX_INFLIGHT, thread_name_prefix="dnsbl")
+    return dnsbl_executor
+
+async def async_test_and_check_proxy(proxy, protocol_hint=None):
+    """Async counterpart of test_and_check_proxy; returns the same (is_working, dnsbl_listings, proxy, stats) tuple."""
+    stats = await async_probe_proxy(proxy, protocol_hint)
+    is_working = probe_passed(stats)
+    if health_store is not None:
+        health_store.record(proxy, is_working, None if stats["ttfb_ms"] is None else stats["ttfb_ms"] / 1000,
+                            protocol=stats["protocol"])
+    dnsbl_listings = 0
+    if is_working:
+        loop = asyncio.get_running_loop()
+        dnsbl_listings = await loop.run_in_executor(get_dnsbl_executor(), check_dnsbl, proxy.split(":")[0])
+    return is_working, dnsbl_listings, proxy, stats
+
+async def async_validate_proxies(proxies, on_result, concurrency=None, protocol_hints=None):
+    """Tests proxies with at most `concurrency` probes in flight, calling on_result(result) as each finishes."""
+    protocol_hints = protocol_hints or {}
+    concurrency = raise_open_file_limit(min(concurrency or ASYNC_MAX_CONCURRENCY, len(proxies)))
+    pending = iter(proxies)
+    # SOCKS4 probes need the test host's IPv4; resolve it off the event loop before any probe starts
+    await asyncio.get_running_loop().run_in_executor(None, probe_host_address, probe_target()[0])
+
+    async def worker():
+        # A fixed set of workers pulling from one iterator keeps memory flat however many proxies there are
+        for proxy in pending:
+            on_result(await async_test_and_check_proxy(proxy, protocol_hints.get(proxy)))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+# --- Proxy Health Store ---
+# Har proxy ki history SQLite mein rehti hai taaki agla run cold start na kare:
+# baar baar fail hone wale proxies exponential backoff se skip hote hain, known-good pehle test hote hain.
+
+class ProxyHealthStore:
+    """On-disk per-proxy history: last seen/checked/success, failure streak, last latency and detected protocol."""
+
+    def __init__(self, path=None):
+        self.path = path or HEALTH_DB_FILE
+        self.connection = sqlite3.connect(self.path, check_same_thread=False) # Daemon mode flushes from its scrape thread
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS proxy_health (
+                proxy TEXT PRIMARY KEY,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                last_checked REAL,
+                last_success REAL,
+                failure_streak INTEGER NOT NULL DEFAULT 0,
+                latency REAL,
+                protocol TEXT
+            )""")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(proxy_health)")]
+        if "protocol" not in columns: # Database from before protocol detection
+            self.connection.execute("ALTER TABLE proxy_health ADD COLUMN protocol TEXT")
+        # Whole table is kept in memory; worker threads only touch this dict, SQLite is written once in save()
+        self.records = {}
+        for proxy, *fields in self.connection.execute(
+                "SELECT proxy, first_seen, last_seen, last_checked, last_success, failure_streak, latency, protocol FROM proxy_health"):
+            self.records[proxy] = fields
+        self.dirty = set()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock() # Serialises writers of the SQLite connection
+
+    def mark_seen(self, proxies, now=None):
+        """Records that these proxies were scraped in this run."""
+        now = now or time.time()
+        with self.lock:
+            for proxy in proxies:
+                record = self.records.get(proxy)
+                if record is None:
+                    self.records[proxy] = [now, now, None, None, 0, None, None]
+                else:
+                    record[1] = now
+                self.dirty.add(proxy)
+
+    def next_check_at(self, proxy):
+        """Earliest time a failing proxy should be retested; 0 for new or healthy proxies."""
+        record = self.records.get(proxy)
+        if record is None or record[4] == 0 or record[2] is None:
+            return 0
+        backoff = min(HEALTH_BACKOFF_MAX, HEALTH_BACKOFF_BASE * 2 ** (record[4] - 1))
+        return record[2] + backoff
+
+    def is_due(self, proxy, now=None):
+        """False while a failing proxy is still inside its backoff window."""
+        return self.next_check_at(proxy) <= (now or time.time())
+
+    def known_good(self):
+        """Proxies whose most recent check succeeded, fastest first."""
+        with self.lock:
+            good = [(record[5] or TIMEOUT, proxy) for proxy, record in self.records.items() if record[4] == 0 and record[3] is not None]
+        return [proxy for _, proxy in sorted(good)]
+
+    def protocol(self, proxy):
+        """Protocol detected the last time this proxy worked, or None."""
+        record = self.records.get(proxy)
+        return record[6] if record is not None else None
+
+    def record(self, proxy, ok, latency=None, now=None, protocol=None):
+        """Records one check result; safe to call from worker threads."""
+        now = now or time.time()
+        with self.lock:
+            record = self.records.setdefault(proxy, [now, now, None, None, 0, None, None])
+            record[2] = now
+            if ok:
+                record[3] = now
+                record[4] = 0
+                if latency is not None:
+                    record[5] = latency
+                if protocol is not None:
+                    record[6] = protocol
+            else:
+                record[4] += 1
+            self.dirty.add(proxy)
+
+    def flush(self):
+        """Writes changed rows and drops proxies not seen for HEALTH_RETENTION seconds; the database stays open."""
+        with self.flush_lock:
+            with self.lock:
+                rows = [(proxy, *self.records[proxy]) for proxy in self.dirty]
+                self.dirty.clear()
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO proxy_health "
+                    "(proxy, first_seen, last_seen, last_checked, last_success, failure_streak, latency, protocol) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.connection.execute("DELETE FROM proxy_health WHERE last_seen < ?", (time.time() - HEALTH_RETENTION,))
+
+    def save(self):
+        """Flushes and closes the database."""
+        self.flush()
+        self.connection.close()
 
-    unique_proxies = list(set(all_scraped_proxies))
-    print(f"\nTotal unique proxies scraped from all sources: {len(unique_proxies)}")
+health_store = None # Opened by process_scraped_proxies, test functions record into it when set
 
-    if not unique_proxies:
+# --- Candidate Set ---
+# Candidates ek baar parse hokar 48-bit integer ban jaate hain (IPv4 uint32 << 16 | port uint16) aur sorted
+# array('Q') mein rehte hain: string + set entry ke ~150 bytes ki jagah 8 bytes per candidate.
+# Invalid, private aur reserved addresses insert ke waqt hi reject ho jaate hain.
+
+RESERVED_IPV4_NETWORKS = [ # IANA special-purpose ranges that can never be a public proxy
+    "0.0.0.0/8", "10.0.0.0/8", "100.64.0.0/10", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12",
+    "192.0.0.0/24", "192.0.2.0/24", "192.88.99.0/24", "192.168.0.0/16", "198.18.0.0/15",
+    "198.51.100.0/24", "203.0.113.0/24", "224.0.0.0/4", "240.0.0.0/4",
+]
+
+def ipv4_network_range(network):
+    """Returns (first, last) addresses of an IPv4 CIDR block as ints."""
+    address, prefix = network.split("/")
+    start = struct.unpack("!I", socket.inet_aton(address))[0]
+    return start, start | (0xFFFFFFFF >> int(prefix))
+
+RESERVED_IPV4_RANGES = sorted(ipv4_network_range(network) for network in RESERVED_IPV4_NETWORKS)
+RESERVED_IPV4_STARTS = [start for start, _ in RESERVED_IPV4_RANGES]
+
+def is_reserved_ipv4(ip):
+    """True if the IPv4 address (as an int) falls in a private or reserved range."""
+    index = bisect.bisect_right(RESERVED_IPV4_STARTS, ip) - 1
+    return index >= 0 and ip <= RESERVED_IPV4_RANGES[index][1]
+
+CANDIDATE_PATTERN = re.compile(r'(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3}):(\d{1,5})', re.ASCII)
+
+def pack_candidate(candidate):
+    """Parses 'ip:port' into ip << 16 | port; None if malformed, private/reserved, or port out of range."""
+    match = CANDIDATE_PATTERN.fullmatch(candidate.strip())
+    if match is None:
+        return None
+    first, second, third, fourth, port = map(int, match.groups())
+    if first > 255 or second > 255 or third > 255 or fourth > 255 or not 0 < port < 65536:
+        return None
+    ip = first << 24 | second << 16 | third << 8 | fourth
+    if REJECT_RESERVED_ADDRESSES and is_reserved_ipv4(ip):
+        return None
+    return ip << 16 | port
+
+def unpack_candidate(packed):
+    """Turns a packed candidate back into its 'ip:port' string."""
+    return f"{socket.inet_ntoa(struct.pack('!I', packed >> 16))}:{packed & 0xFFFF}"
+
+# Set operations on sorted, unique array('Q') runs. They walk the shorter run with bisect and copy the
+# stretches of the longer one between its values as array slices, so no Python int is built per element.
+
+def sorted_union(left, right):
+    if len(left) < len(right):
+        left, right = right, left
+    merged = array('Q')
+    start = 0
+    for value in right:
+        index = bisect.bisect_left(left, value, start)
+        merged.extend(left[start:index])
+        merged.append(value)
+        start = index + 1 if index < len(left) and left[index] == value else index
+    merged.extend(left[start:])
+    return merged
+
+def sorted_difference(left, right):
+    remaining = array('Q')
+    if len(right) <= len(left):
+        start = 0
+        for value in right:
+            index = bisect.bisect_left(left, value, start)
+            remaining.extend(left[start:index])
+            start = index + 1 if index < len(left) and left[index] == value else index
+        remaining.extend(left[start:])
+        return remaining
+    start = 0
+    for value in left:
+        start = bisect.bisect_left(right, value, start)
+        if start == len(right) or right[start] != value:
+            remaining.append(value)
+    return remaining
+
+def sorted_intersection(left, right):
+    if len(left) > len(right):
+        left, right = right, left
+    common = array('Q')
+    start = 0
+    for value in left:
+        start = bisect.bisect_left(right, value, start)
+        if start == len(right):
+            break
+        if right[start] == value:
+            common.append(value)
+    return common
+
+class CandidateSet:
+    """Set of ip:port candidates stored as packed ints in a sorted array('Q') plus a small insert buffer."""
+
+    MIN_MERGE_SIZE = 4096
+
+    def __init__(self, candidates=()):
+        self.packed = array('Q') # Sorted, unique
+        self.pending = set() # Recent inserts, merged into the array in bulk
+        self.rejected = 0 # Malformed / private / reserved entries refused at insert time
+        for candidate in candidates:
+            self.add(candidate)
+
+    @classmethod
+    def from_packed(cls, packed_values):
+        candidate_set = cls()
+        candidate_set.packed = array('Q', sorted(set(packed_values)))
+        return candidate_set
+
+    @classmethod
+    def from_sorted(cls, packed):
+        """Wraps an already sorted, unique array('Q') without copying it."""
+        candidate_set = cls()
+        candidate_set.packed = packed
+        return candidate_set
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads a plain 'ip:port' per line file (e.g. the previous run's OUTPUT_FILE); empty if it doesn't exist."""
+        try:
+            with open(path) as f:
+                return cls(line for line in f if line.strip())
+        except FileNotFoundError:
+            return cls()
+
+    def add(self, candidate):
+        """Adds an 'ip:port' string; True if it was valid and not already present."""
+        packed = pack_candidate(candidate)
+        if packed is None:
+            self.rejected += 1
+            return False
+        return self.add_packed(packed)
+
+    def add_packed(self, packed):
+        if self.contains_packed(packed):
+            return False
+        self.pending.add(packed)
+        # Merging when the buffer reaches 1/8 of the array keeps total merge work linear
+        if len(self.pending) >= max(self.MIN_MERGE_SIZE, len(self.packed) // 8):
+            self.merge()
+        return True
+
+    def contains_packed(self, packed):
+        if packed in self.pending:
+            return True
+        index = bisect.bisect_left(self.packed, packed)
+        return index < len(self.packed) and self.packed[index] == packed
+
+    def merge(self):
+        if self.pending:
+            # Pending values are never in the array already (add_packed checks), so this is a plain merge
+            self.packed = sorted_union(self.packed, array('Q', sorted(self.pending)))
+            self.pending = set()
+
+    def packed_values(self):
+        self.merge()
+        return self.packed
+
+    def __contains__(self, candidate):
+        packed = candidate if isinstance(candidate, int) else pack_candidate(candidate)
+        return packed is not None and self.contains_packed(packed)
+
+    def __len__(self):
+        return len(self.packed) + len(self.pending)
+
+    def __iter__(self):
+        return (unpack_candidate(packed) for packed in self.packed_values())
+
+    def union(self, other):
+        return CandidateSet.from_sorted(sorted_union(self.packed_values(), other.packed_values()))
+
+    def difference(self, other):
+        return CandidateSet.from_sorted(sorted_difference(self.packed_values(), other.packed_values()))
+
+    def intersection(self, other):
+        return CandidateSet.from_sorted(sorted_intersection(self.packed_values(), other.packed_values()))
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def nbytes(self):
+        """Approximate memory used by the packed array (the insert buffer is at most 1/8 of it)."""
+        return self.packed.itemsize * len(self.packed)
+
+# --- Streaming Pipeline ---
+# Scrape -> dedup -> TCP prefilter -> validate stages bounded queues se jude hain. Pehla page aate hi
+# validation shuru ho jaati hai, isliye ek slow site poore validation phase ko nahi rokti,
+# aur memory queue sizes se bounded rehti hai.
+
+PIPELINE_DONE = object() # Queue sentinel: the upstream stage has finished
+
+RANKED_FIELDS = ("proxy", "protocol", "score", "ttfb_ms", "connect_ms", "success_ratio", "probes", "last_checked")
+
+def write_ranked_proxies(ranked, json_file=None, csv_file=None):
+    """Writes working proxies best score first (ties by protocol, then most recently checked) as JSON and CSV."""
+    ranked = sorted(ranked, key=lambda entry: entry["last_checked"], reverse=True)
+    ranked.sort(key=lambda entry: (entry["score"], entry["protocol"]))
+    json_file = json_file or OUTPUT_JSON_FILE
+    csv_file = csv_file or OUTPUT_CSV_FILE
+    with open(json_file + ".partial", "w") as f:
+        json.dump([{field: entry[field] for field in RANKED_FIELDS} for entry in ranked], f, indent=2)
+    os.replace(json_file + ".partial", json_file)
+    with open(csv_file + ".partial", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RANKED_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(ranked)
+    os.replace(csv_file + ".partial", csv_file)
+
+class ProxyPipeline:
+    """Runs scraping and validation concurrently, writing working proxies out as they are confirmed."""
+
+    def __init__(self, targets=None, output_file=None, on_working=None):
+        self.targets = targets or SCRAPING_TARGETS
+        self.output_file = output_file or OUTPUT_FILE
+        self.on_working = on_working # Optional callback(proxy, ranked_entry) for each working, clean proxy
+        self.page_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE) # (site_name, page_proxies)
+        self.candidate_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE) # Unique proxies waiting for the prefilter
+        self.validate_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE) # Proxies waiting for a validator
+        # Probe sockets and the parallel prefilter batches are open at the same time, budget fds for both
+        prefilter_fds = TCP_PREFILTER_PARALLEL_BATCHES * TCP_PREFILTER_BATCH if USE_TCP_PREFILTER else 0
+        if USE_ASYNC_VALIDATION:
+            available = raise_open_file_limit(ASYNC_MAX_CONCURRENCY + prefilter_fds)
+            self.validator_count = max(1, min(ASYNC_MAX_CONCURRENCY, available - prefilter_fds))
+        else:
+            available = raise_open_file_limit(MAX_WORKERS + prefilter_fds)
+            self.validator_count = MAX_WORKERS # One probe or DNSBL socket per thread at a time
+        # Prefilter batches shrink to what the validators leave, rather than running into EMFILE
+        self.prefilter_batch_size = max(1, min(TCP_PREFILTER_BATCH, (available - self.validator_count) // TCP_PREFILTER_PARALLEL_BATCHES))
+        self.seen = CandidateSet()
+        self.protocol_hints = {} # Proxy -> 'protocol' of the site it came from, only for sites that set one
+        self.tally = SourceTally()
+        self.previous = CandidateSet.from_file(self.output_file) # Last run's results, for the run-to-run diff
+        self.working_clean_proxies = []
+        self.ranked = [] # Probe stats of working, clean proxies, for the JSON/CSV outputs
+        self.scraped_count = 0
+        self.page_count = 0
+        self.seeded_count = 0
+        self.skipped_count = 0
+        self.reachable_count = 0
+        self.tested_count = 0
+        self.output = None
+        self.started = None
+        self.stages = None
+        self.stopped_early = False
+        self.probe_stop = None if USE_ASYNC_VALIDATION else ProbeStop() # Cancelling the stages doesn't reach probe threads
+
+    def stage_done(self, stage, summary):
+        elapsed = time.perf_counter() - self.started
+        run_metrics.stage_finished[stage] = round(elapsed, 3)
+        print(f"[stage] {stage}: {summary}, finished {elapsed:.1f}s into the run")
+
+    async def run(self):
+        self.started = time.perf_counter()
+        scheduler = ScrapeScheduler(page_sink=self.page_queue.put)
+        executor = None if USE_ASYNC_VALIDATION else ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        partial_file = self.output_file + ".partial"
+        if USE_ASYNC_VALIDATION:
+            print(f"Using asyncio validation engine with up to {self.validator_count} probes in flight.")
+        # SOCKS4 probes need the test host's IPv4; resolve it once here rather than inside the event loop
+        await asyncio.get_running_loop().run_in_executor(None, probe_host_address, probe_target()[0])
+        try:
+            with open(partial_file, "w") as self.output:
+                dedup_output = self.candidate_queue if USE_TCP_PREFILTER else self.validate_queue
+                stages = [self.scrape_stage(scheduler), self.dedup_stage(dedup_output), self.validate_stage(executor)]
+                if USE_TCP_PREFILTER:
+                    stages.append(self.prefilter_stage())
+                self.stages = asyncio.gather(*stages)
+                try:
+                    await self.stages
+                except asyncio.CancelledError:
+                    if not self.stopped_early:
+                        raise
+        finally:
+            scheduler.close()
+            if executor is not None:
+                # Queued probes are dropped and running ones abort at once, so none writes state after the run
+                self.probe_stop.set()
+                executor.shutdown(wait=True, cancel_futures=True)
+        print(f"[stage] total: {time.perf_counter() - self.started:.1f}s wall time")
+
+        current = CandidateSet(self.working_clean_proxies)
+        print(f"Compared with the previous run: {len(current - self.previous)} new, "
+              f"{len(current & self.previous)} still working, {len(self.previous - current)} dropped.")
+
+        if self.working_clean_proxies:
+            os.replace(partial_file, self.output_file) # Old list stays in place until the new one is complete
+            write_ranked_proxies(self.ranked)
+        else:
+            os.remove(partial_file)
+        return self.working_clean_proxies
+
+    async def close_queue(self, queue, consumers=1):
+        for _ in range(consumers):
+            await queue.put(PIPELINE_DONE)
+
+    async def scrape_stage(self, scheduler):
+        await scheduler.scrape_all(self.targets)
+        await self.close_queue(self.page_queue)
+
+    async def dedup_stage(self, output_queue):
+        """Drops repeats as pages arrive; known-good proxies from earlier runs are queued first."""
+        now = time.time()
+        for proxy in health_store.known_good():
+            if self.seen.add(proxy):
+                await output_queue.put(proxy)
+        self.seeded_count = len(self.seen)
+
+        while (item := await self.page_queue.get()) is not PIPELINE_DONE:
+            site_name, page_proxies = item
+            protocol_hint = self.targets.get(site_name, {}).get("protocol")
+            self.page_count += 1
+            self.scraped_count += len(page_proxies)
+            listed = [] # Normalised, so junk rows never reach the health store and spellings share one record
+            for proxy in page_proxies:
+                packed = pack_candidate(proxy)
+                if packed is None:
+                    self.seen.rejected += 1
+                    continue
+                listed.append(packed)
+                self.tally.add(site_name, packed)
+                if not self.seen.add_packed(packed):
+                    continue
+                proxy = unpack_candidate(packed) # Normalised form, e.g. '010.1.1.1:080' -> '10.1.1.1:80'
+                if not health_store.is_due(proxy, now):
+                    self.skipped_count += 1
+                    continue
+                if protocol_hint:
+                    self.protocol_hints[proxy] = protocol_hint
+                await output_queue.put(proxy)
+            health_store.mark_seen(map(unpack_candidate, listed))
+
+        self.seen.merge()
+        self.stage_done("scrape", f"{self.scraped_count} candidates from {self.page_count} pages")
+        self.stage_done("dedup", f"{len(self.seen)} unique ({self.seeded_count} known-good seeded), "
+                                 f"{self.seen.rejected} invalid/reserved rejected, {self.skipped_count} skipped (failure backoff), "
+                                 f"{self.seen.nbytes() // 1024} KiB packed")
+        await self.close_queue(output_queue, 1 if USE_TCP_PREFILTER else self.validator_count)
+
+    async def next_batch(self, queue):
+        """Returns (batch, upstream_done); after the first item, gathers more for up to PREFILTER_BATCH_WAIT seconds."""
+        loop = asyncio.get_running_loop()
+        batch = []
+        item = await queue.get()
+        deadline = loop.time() + PREFILTER_BATCH_WAIT
+        while True:
+            if item is PIPELINE_DONE:
+                return batch, True
+            batch.append(item)
+            if len(batch) >= TCP_PREFILTER_BATCH:
+                return batch, False
+            while queue.empty():
+                if loop.time() >= deadline:
+                    return batch, False
+                await asyncio.sleep(0.02)
+            item = queue.get_nowait()
+
+    async def prefilter_stage(self):
+        """Runs tcp_prefilter on micro-batches, several batches at a time, feeding survivors to the validators."""
+        loop = asyncio.get_running_loop()
+        prefilter = run_metrics.profiled("tcp-prefilter", tcp_prefilter)
+        slots = asyncio.Semaphore(TCP_PREFILTER_PARALLEL_BATCHES)
+        running = set()
+        checked = 0
+
+        async def check(batch):
+            try:
+                failed = []
+                reachable = await loop.run_in_executor(None, prefilter, batch, None, self.prefilter_batch_size, failed)
+                for proxy in failed: # Only connects that were attempted; a candidate never tried is not a failure
+                    health_store.record(proxy, False)
+                self.reachable_count += len(reachable)
+                for proxy in reachable:
+                    await self.validate_queue.put(proxy)
+            finally:
+                slots.release() # Held until the survivors are queued, so a full queue pauses the prefilter
+
+        upstream_done = False
+        while not upstream_done:
+            batch, upstream_done = await self.next_batch(self.candidate_queue)
+            if batch:
+                checked += len(batch)
+                await slots.acquire()
+                task = asyncio.ensure_future(check(batch))
+                running.add(task)
+                task.add_done_callback(running.discard)
+        await asyncio.gather(*running)
+        self.stage_done("tcp-prefilter", f"{self.reachable_count}/{checked} reachable")
+        await self.close_queue(self.validate_queue, self.validator_count)
+
+    async def validate_stage(self, executor):
+        loop = asyncio.get_running_loop()
+        check_proxy = run_metrics.profiled("validate", test_and_check_proxy)
+
+        async def validator():
+            while (proxy := await self.validate_queue.get()) is not PIPELINE_DONE:
+                site_hint = self.protocol_hints.pop(proxy, None)
+                protocol_hint = health_store.protocol(proxy) or site_hint # What worked last time beats the listing
+                if executor is None:
+                    result = await async_test_and_check_proxy(proxy, protocol_hint)
+                else:
+                    result = await loop.run_in_executor(executor, check_proxy, proxy, protocol_hint, self.probe_stop)
+                self.handle_result(result)
+
+        await asyncio.gather(*(validator() for _ in range(self.validator_count)))
+        self.stage_done("validate", f"{len(self.working_clean_proxies)}/{self.tested_count} working and clean, "
+                                    f"probe timeout settled at {probe_timeout.current():.1f}s")
+
+    def handle_result(self, result):
+        is_working, dnsbl_listings, proxy, stats = result
+        self.tested_count += 1
+        if self.tested_count % 50 == 0:
+            print(f"Processed {self.tested_count} proxies so far. Found {len(self.working_clean_proxies)} working and clean.")
+
+        if is_working and dnsbl_listings == 0:
+            self.working_clean_proxies.append(proxy)
+            self.ranked.append({"proxy": proxy, **stats})
+            self.tally.credit_working(proxy)
+            if self.on_working is not None:
+                self.on_working(proxy, self.ranked[-1])
+            self.output.write(proxy + "\n")
+            self.output.flush() # Confirmed proxies reach disk right away
+            if TARGET_WORKING_PROXIES and len(self.working_clean_proxies) >= TARGET_WORKING_PROXIES and not self.stopped_early:
+                self.stopped_early = True
+                if self.probe_stop is not None:
+                    self.probe_stop.set()
+                self.stage_done("early-stop", f"{TARGET_WORKING_PROXIES} working proxies found after {self.tested_count} tests, "
+                                              "cancelling outstanding scraping and validation")
+                self.stages.cancel()
+        # elif is_working:
+        #     print(f"Proxy {proxy} is working but listed on {dnsbl_listings} DNSBLs. Skipping.")
+        # else:
+        #     print(f"Proxy {proxy} failed connectivity test. Skipping.")
+
+def run_scrape_cycle(on_working=None):
+    """One scrape + validate pass with fresh run metrics; persists the caches and writes the metrics files."""
+    global run_metrics
+    run_metrics = RunMetrics()
+    targets = source_stats.plan(SCRAPING_TARGETS) if SOURCE_ADAPTIVE_BUDGETS else SCRAPING_TARGETS
+    pipeline = ProxyPipeline(targets, on_working=on_working)
+    # The async engine runs everything on one thread, so the whole event loop is profiled as one stage
+    run_pipeline = run_metrics.profiled("event-loop", asyncio.run) if USE_ASYNC_VALIDATION else asyncio.run
+    try:
+        run_pipeline(pipeline.run())
+    finally:
+        dnsbl_resolver.save()
+        health_store.flush()
+        if page_cache is not None:
+            page_cache.flush()
+    print(f"DNSBL cache: {dnsbl_resolver.hits} hits, {dnsbl_resolver.misses} lookups.")
+    source_stats.record_run(run_metrics.sites, pipeline.tally, targets, SCRAPING_TARGETS, complete=not pipeline.stopped_early)
+    source_stats.save()
+
+    run_metrics.set_gauge("working_proxies", len(pipeline.working_clean_proxies))
+    run_metrics.set_gauge("unique_candidates", len(pipeline.seen))
+    run_metrics.set_gauge("dnsbl_cache_hits", dnsbl_resolver.hits)
+    run_metrics.set_gauge("dnsbl_cache_misses", dnsbl_resolver.misses)
+    run_metrics.set_gauge("probe_timeout_seconds", probe_timeout.current())
+    run_metrics.write_json()
+    run_metrics.write_prometheus()
+    print(f"Run metrics written to {METRICS_JSON_FILE} and {METRICS_PROM_FILE}.")
+    if PROFILE_STAGES:
+        paths = run_metrics.write_profiles()
+        print(f"Stage profiles written: {', '.join(paths) or 'none'}"
+              + (f" ({run_metrics.profile_skipped} calls skipped, another profiler was active)" if run_metrics.profile_skipped else ""))
+    return pipeline
+
+def open_state():
+    """Compiles the site extractors and opens the health store, page cache, DNSBL cache and source stats."""
+    global health_store, page_cache
+    compile_site_extractors()
+    health_store = ProxyHealthStore()
+    if USE_PAGE_CACHE:
+        page_cache = PageCache()
+        print(f"Page cache has {len(page_cache)} source pages from earlier runs.")
+    print(f"Loaded {dnsbl_resolver.load()} cached DNSBL results from {DNSBL_CACHE_FILE}.")
+    print(f"Loaded yield history for {source_stats.load()} sites from {SOURCE_STATS_FILE}.")
+
+def close_state():
+    """Saves and closes the health store and page cache."""
+    health_store.save()
+    if page_cache is not None:
+        page_cache.save()
+
+def process_scraped_proxies():
+    """Main function to scrape, test, and save proxies."""
+    open_state()
+    print("Starting proxy scraping from configured websites. Validation starts as soon as the first proxies arrive...")
+    try:
+        pipeline = run_scrape_cycle()
+    finally:
+        close_state()
+    working_clean_proxies = pipeline.working_clean_proxies
+
+    if not pipeline.seen:
         print("No proxies scraped. Exiting.")
         return
+    print(f"\nFound {len(working_clean_proxies)} working and clean proxies.")
+    if working_clean_proxies:
+        print(f"Working proxies saved to {OUTPUT_FILE}, ranked by latency score in {OUTPUT_JSON_FILE} and {OUTPUT_CSV_FILE}")
+    else:
+        print("No working and clean proxies found to save.")
 
-    working_clean_proxies = []
-    print(f"\nStarting connectivity and DNSBL checks for {len(unique_proxies)} proxies. This may take a while...")
+# --- Daemon Mode ---
+# `--daemon` par script chalta rehta hai: working proxies ka live pool memory mein, sources har
+# DAEMON_RESCRAPE_INTERVAL par dobara scrape, aur pool ke members lagataar priority order mein re-probe hote hain.
+# Local HTTP API pool serve karti hai; readers lock nahi lete, sirf immutable snapshot padhte hain.
 
-    # Use a separate ThreadPoolExecutor for testing, as it's I/O bound
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        test_futures = {executor.submit(test_and_check_proxy, proxy): proxy for proxy in unique_proxies}
-        
-        tested_count = 0
-        for future in as_completed(test_futures):
-            is_working, dnsbl_listings, proxy = future.result()
-            tested_count += 1
-            if tested_count % 50 == 0 or tested_count == len(unique_proxies):
-                print(f"Processed {tested_count}/{len(unique_proxies)} proxies. Found {len(working_clean_proxies)} working and clean.")
+class ProxyPool:
+    """Live pool of working proxies with a revalidation schedule.
 
+    Readers use `snapshot`, an immutable tuple of entries sorted by score, without locking; writers
+    change `entries` under the lock and publish a new snapshot (copy-on-write).
+    """
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.entries = {} # Proxy -> ranked entry, proxies currently being served
+        self.suspended = {} # Proxy -> entry, reported failed and waiting for their re-probe
+        self.due = [] # Heap of (due_at, proxy) revalidation times
+        self.due_at = {} # Proxy -> time of its live heap item; heap items that don't match are stale
+        self.snapshot = ()
+        self.stopping = False
+
+    def publish(self):
+        """Rebuilds the read snapshot; caller holds the lock."""
+        self.snapshot = tuple(sorted(self.entries.values(), key=lambda entry: (entry["score"], entry["protocol"])))
+
+    def schedule(self, proxy, due_at):
+        """Queues a revalidation unless one is already due sooner; caller holds the lock."""
+        if self.due_at.get(proxy, float("inf")) <= due_at:
+            return
+        self.due_at[proxy] = due_at
+        heapq.heappush(self.due, (due_at, proxy))
+        self.lock.notify()
+
+    def add(self, proxy, entry):
+        """Adds or refreshes a proxy that just passed validation."""
+        with self.lock:
+            self.suspended.pop(proxy, None)
+            self.entries[proxy] = entry
+            self.schedule(proxy, time.time() + DAEMON_REVALIDATE_INTERVAL)
+            self.publish()
+
+    def report_failed(self, proxy):
+        """Takes a proxy out of rotation and queues it for an immediate re-probe; False if it isn't in the pool."""
+        with self.lock:
+            entry = self.entries.pop(proxy, None)
+            if entry is None:
+                return proxy in self.suspended
+            self.suspended[proxy] = entry
+            self.publish()
+            self.schedule(proxy, 0) # Reported proxies jump the queue
+            return True
+
+    def next_due(self):
+        """Blocks until a proxy is due for revalidation; returns (proxy, protocol), or None once stopped."""
+        with self.lock:
+            while not self.stopping:
+                if not self.due:
+                    self.lock.wait()
+                    continue
+                due_at, proxy = self.due[0]
+                if self.due_at.get(proxy) != due_at:
+                    heapq.heappop(self.due) # Rescheduled or already checked
+                    continue
+                wait = due_at - time.time()
+                if wait > 0:
+                    self.lock.wait(wait)
+                    continue
+                heapq.heappop(self.due)
+                del self.due_at[proxy]
+                entry = self.entries.get(proxy) or self.suspended.get(proxy)
+                if entry is not None:
+                    return proxy, entry["protocol"]
+            return None
+
+    def checked(self, proxy, entry):
+        """Applies a revalidation result: `entry` keeps the proxy in the pool, None drops it."""
+        if entry is not None:
+            self.add(proxy, entry)
+            return
+        with self.lock:
+            self.suspended.pop(proxy, None)
+            if self.entries.pop(proxy, None) is not None:
+                self.publish()
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.lock.notify_all()
+
+    def get(self, count=1, protocol=None, max_latency_ms=None):
+        """Up to `count` (capped at DAEMON_MAX_COUNT) best-scoring proxies; `protocol` "socks" matches both SOCKS versions. Lock-free."""
+        count = min(count, DAEMON_MAX_COUNT)
+        picked = []
+        if count < 1:
+            return picked
+        for entry in self.snapshot:
+            if protocol and entry["protocol"] != protocol and not (protocol == "socks" and entry["protocol"].startswith("socks")):
+                continue
+            if max_latency_ms is not None and entry["ttfb_ms"] > max_latency_ms:
+                continue
+            picked.append(entry)
+            if len(picked) >= count:
+                break
+        return picked
+
+    def size(self):
+        snapshot = self.snapshot
+        by_protocol = {}
+        for entry in snapshot:
+            by_protocol[entry["protocol"]] = by_protocol.get(entry["protocol"], 0) + 1
+        return {"size": len(snapshot), "suspended": len(self.suspended), "by_protocol": by_protocol}
+
+def revalidate_pool(pool):
+    """Worker thread: re-probes pool members as they fall due, reported failures first."""
+    while (item := pool.next_due()) is not None:
+        proxy, protocol = item
+        is_working, dnsbl_listings, _, stats = test_and_check_proxy(proxy, protocol)
+        pool.checked(proxy, {"proxy": proxy, **stats} if is_working and dnsbl_listings == 0 else None)
+
+def rescrape_forever(pool, stop):
+    """Scrape thread: runs a full scrape + validate cycle every DAEMON_RESCRAPE_INTERVAL seconds, feeding the pool."""
+    while not stop.is_set():
+        try:
+            pipeline = run_scrape_cycle(on_working=pool.add)
+            print(f"Scrape cycle done: {len(pipeline.working_clean_proxies)} working proxies found, pool size {len(pool.snapshot)}.")
+        except Exception as e:
+            print(f"Scrape cycle failed: {e}")
+        stop.wait(DAEMON_RESCRAPE_INTERVAL)
+
+class ProxyApiHandler(BaseHTTPRequestHandler):
+    """GET /proxies?count=N&protocol=P&max_latency_ms=M, POST /report?proxy=ip:port, GET /size."""
+
+    def log_message(self, format, *args):
+        pass # Consumers poll often, keep the console for scrape progress
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        pool = self.server.pool
+        if url.path == "/proxies":
+            try:
+                count = int(query.get("count", ["1"])[0])
+                max_latency_ms = float(query["max_latency_ms"][0]) if "max_latency_ms" in query else None
+            except ValueError:
+                return self.send_json(400, {"error": "count and max_latency_ms must be numbers"})
+            if count < 1:
+                return self.send_json(400, {"error": f"count must be at least 1 (at most {DAEMON_MAX_COUNT} proxies are returned)"})
+            protocol = query.get("protocol", [None])[0]
+            return self.send_json(200, {"proxies": pool.get(count, protocol, max_latency_ms)})
+        if url.path == "/size":
+            return self.send_json(200, pool.size())
+        self.send_json(404, {"error": "unknown endpoint, use /proxies, /report or /size"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/report":
+            return self.send_json(404, {"error": "unknown endpoint, use /proxies, /report or /size"})
+        proxy = parse_qs(url.query).get("proxy", [None])[0]
+        if not proxy:
+            return self.send_json(400, {"error": "proxy parameter is required"})
+        self.send_json(200, {"proxy": proxy, "known": self.server.pool.report_failed(proxy)})
+
+def run_daemon(host=DAEMON_HOST, port=DAEMON_PORT):
+    """Keeps a live proxy pool and serves it on a local HTTP API until interrupted."""
+    open_state()
+    pool = ProxyPool()
+    stop = threading.Event()
+    workers = [threading.Thread(target=rescrape_forever, args=(pool, stop), name="rescrape", daemon=True)]
+    workers += [threading.Thread(target=revalidate_pool, args=(pool,), name=f"revalidate-{index}", daemon=True)
+                for index in range(DAEMON_REVALIDATE_WORKERS)]
+    for worker in workers:
+        worker.start()
+
+    server = ThreadingHTTPServer((host, port), ProxyApiHandler)
+    server.pool = pool
+    print(f"Serving the proxy pool on http://{host}:{server.server_address[1]}/ (GET /proxies, POST /report, GET /size). Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping daemon...")
+    finally:
+        server.server_close()
+        stop.set()
+        pool.stop()
+        dnsbl_resolver.save()
+        close_state()
+
+# --- Sharded Validation ---
+# `--coordinator` scrape aur dedup karta hai, phir candidates ko ip:port ke stable hash se SHARD_COUNT
+# shards mein baant deta hai. Workers (`--worker host:port`, isi machine ya doosri) TCP par JSON lines
+# protocol se shard lease karte hain, validate karke results bhejte hain; coordinator sab merge karke output likhta hai.
+# Worker ka connection toote ya lease expire ho to uska shard dobara queue mein chala jata hai.
+
+SHARD_MESSAGE_LIMIT = 64 * 1024 * 1024 # Longest JSON line the coordinator accepts (a shard's results)
+
+def shard_of(proxy, shard_count=None):
+    """Stable shard number for a candidate (crc32, so every process and machine agrees)."""
+    return zlib.crc32(proxy.encode()) % (shard_count or SHARD_COUNT)
+
+def collect_candidates(targets=None):
+    """Scrapes every site; returns (unique candidates, {proxy: protocol hint}, SourceTally), known-good proxies first."""
+    now = time.time()
+    seen = CandidateSet()
+    tally = SourceTally()
+    candidates = []
+    hints = {}
+    for proxy in health_store.known_good():
+        if seen.add(proxy):
+            candidates.append(proxy)
+    targets = targets or SCRAPING_TARGETS
+    for site_name, site_proxies in scrape_all_sites(targets).items():
+        site_hint = targets[site_name].get("protocol")
+        listed = []
+        for proxy in site_proxies:
+            packed = pack_candidate(proxy)
+            if packed is None:
+                continue
+            listed.append(packed)
+            tally.add(site_name, packed)
+            if not seen.add_packed(packed):
+                continue
+            proxy = unpack_candidate(packed)
+            if health_store.is_due(proxy, now):
+                candidates.append(proxy)
+                if site_hint:
+                    hints[proxy] = site_hint
+        health_store.mark_seen(map(unpack_candidate, listed)) # Normalised, invalid and reserved rows left out
+    for proxy in candidates:
+        if health_store.protocol(proxy):
+            hints[proxy] = health_store.protocol(proxy) # What worked last time beats the listing
+    return candidates, hints, tally
+
+class ShardCoordinator:
+    """Hands out candidate shards to workers over JSON lines, re-queues lost shards and merges the results.
+
+    Worker messages: {"op": "lease"} is answered with {"shard", "proxies", "hints"}, {"wait": seconds} or
+    {"done": true}; {"op": "heartbeat", "shard"} extends a lease; {"op": "result", "shard", "results", "dnsbl", "stages"} completes it, carrying the worker's new
+    DNSBL cache entries and stage counters along.
+    """
+
+    def __init__(self, candidates, hints, shard_count=None):
+        shards = {}
+        for proxy in candidates:
+            shards.setdefault(shard_of(proxy, shard_count), []).append(proxy)
+        self.shards = shards
+        self.hints = hints
+        self.pending = deque(sorted(shards))
+        self.leases = {} # Shard -> (worker connection id, lease deadline)
+        self.done = set()
+        self.reassigned = 0
+        self.working = [] # Ranked entries of working, clean proxies
+        self.tested = 0
+        self.finished = None # asyncio.Event, set once every shard has a result
+        self.connections = set() # Writers of connected workers
+
+    def lease(self, connection_id):
+        if len(self.done) == len(self.shards):
+            return {"done": True}
+        if not self.pending:
+            return {"wait": 1} # Everything is leased; a shard may still come back
+        shard = self.pending.popleft()
+        self.leases[shard] = (connection_id, time.monotonic() + SHARD_LEASE_SECONDS)
+        proxies = self.shards[shard]
+        return {"shard": shard, "proxies": proxies, "hints": {proxy: self.hints[proxy] for proxy in proxies if proxy in self.hints}}
+
+    def requeue(self, shard, reason):
+        del self.leases[shard]
+        self.pending.appendleft(shard) # Lost shards go out before untouched ones
+        self.reassigned += 1
+        print(f"[coordinator] Shard {shard} re-queued ({reason}).")
+
+    def complete(self, shard, results, dnsbl_entries, stages):
+        # Lookups and probe counters are real work even when this is a duplicate result
+        dnsbl_resolver.merge(dnsbl_entries)
+        run_metrics.merge_stages(stages)
+        if shard in self.done:
+            return # A re-queued shard finished twice; the first result stands
+        self.done.add(shard)
+        self.leases.pop(shard, None)
+        if shard in self.pending:
+            self.pending.remove(shard)
+        for proxy, is_working, dnsbl_listings, stats in results:
+            self.tested += 1
+            latency = None if stats is None or stats["ttfb_ms"] is None else stats["ttfb_ms"] / 1000
+            health_store.record(proxy, is_working, latency, protocol=stats and stats["protocol"])
             if is_working and dnsbl_listings == 0:
-                working_clean_proxies.append(proxy)
-            # elif is_working:
-            #     print(f"Proxy {proxy} is working but listed on {dnsbl_listings} DNSBLs. Skipping.")
-            # else:
-            #     print(f"Proxy {proxy} failed connectivity test. Skipping.")
+                self.working.append({"proxy": proxy, **stats})
+        print(f"[coordinator] Shard {shard} done ({len(self.done)}/{len(self.shards)}), {len(self.working)} working so far.")
+        if len(self.done) == len(self.shards):
+            self.finished.set()
 
-    print(f"\nFound {len(working_clean_proxies)} working and clean proxies.")
+    async def handle_worker(self, reader, writer):
+        connection_id = id(writer)
+        self.connections.add(writer)
+        try:
+            while line := await reader.readline():
+                message = json.loads(line)
+                if message["op"] == "lease":
+                    writer.write(json.dumps(self.lease(connection_id)).encode() + b"\n")
+                    await writer.drain()
+                elif message["op"] == "heartbeat" and self.leases.get(message["shard"], (None,))[0] == connection_id:
+                    self.leases[message["shard"]] = (connection_id, time.monotonic() + SHARD_LEASE_SECONDS)
+                elif message["op"] == "result":
+                    self.complete(message["shard"], message["results"], message.get("dnsbl", {}), message.get("stages", {}))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[coordinator] Dropping worker connection: {e}")
+        finally:
+            for shard, (owner, _) in list(self.leases.items()):
+                if owner == connection_id:
+                    self.requeue(shard, "worker disconnected")
+            self.connections.discard(writer)
+            writer.close()
 
-    if working_clean_proxies:
-        with open(OUTPUT_FILE, "w") as f:
-            for proxy in working_clean_proxies:
-                f.write(proxy + "\n")
-        print(f"Working proxies saved to {OUTPUT_FILE}")
+    async def expire_leases(self):
+        while not self.finished.is_set():
+            now = time.monotonic()
+            for shard, (_, deadline) in list(self.leases.items()):
+                if deadline < now:
+                    self.requeue(shard, "lease expired")
+            await asyncio.sleep(1)
+
+    async def run(self, host, port, local_workers=0):
+        """Serves shards until all are done; starts `local_workers` worker processes on this machine."""
+        self.finished = asyncio.Event()
+        if not self.shards:
+            return
+        server = await asyncio.start_server(self.handle_worker, host, port, limit=SHARD_MESSAGE_LIMIT)
+        address = f"{host}:{server.sockets[0].getsockname()[1]}"
+        print(f"[coordinator] {sum(map(len, self.shards.values()))} candidates in {len(self.shards)} shards, "
+              f"waiting for workers on {address}.")
+        workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", address])
+                   for _ in range(local_workers)]
+        watchdog = asyncio.ensure_future(self.expire_leases())
+        try:
+            await self.finished.wait()
+        finally:
+            watchdog.cancel()
+            server.close()
+            for worker in workers:
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, worker.wait, 30)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+            for writer in list(self.connections):
+                writer.close() # Workers still holding a lease that was already done elsewhere
+            await asyncio.sleep(0) # Let their handlers see the EOF and finish
+
+def validate_shard(proxies, hints):
+    """Worker side: prefilters and probes one shard; returns [proxy, is_working, dnsbl_listings, stats] rows."""
+    reachable = tcp_prefilter(proxies) if USE_TCP_PREFILTER else proxies
+    reachable_set = set(reachable)
+    results = [[proxy, False, 0, None] for proxy in proxies if proxy not in reachable_set]
+    if USE_ASYNC_VALIDATION:
+        checked = []
+        asyncio.run(async_validate_proxies(reachable, checked.append, protocol_hints=hints))
     else:
-        print("No working and clean proxies found to save.")
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            checked = list(executor.map(lambda proxy: test_and_check_proxy(proxy, hints.get(proxy)), reachable))
+    results.extend([proxy, is_working, dnsbl_listings, stats] for is_working, dnsbl_listings, proxy, stats in checked)
+    return results
+
+def run_worker(address):
+    """Pulls shards from a coordinator at host:port and validates them until it says done."""
+    host, port = address.rsplit(":", 1)
+    print(f"Loaded {dnsbl_resolver.load()} cached DNSBL results from {DNSBL_CACHE_FILE}.")
+    dnsbl_resolver.take_new_entries() # Start tracking; the coordinator persists what this worker looks up
+    connection = socket.create_connection((host, int(port)))
+    stream = connection.makefile("rb")
+    send_lock = threading.Lock() # Heartbeats are sent from a second thread
+
+    def send(message):
+        with send_lock:
+            connection.sendall(json.dumps(message).encode() + b"\n")
+
+    try:
+        while True:
+            send({"op": "lease"})
+            line = stream.readline()
+            if not line:
+                print("Coordinator closed the connection.")
+                return
+            reply = json.loads(line)
+            if reply.get("done"):
+                return
+            if "wait" in reply:
+                time.sleep(reply["wait"])
+                continue
+            shard = reply["shard"]
+            print(f"[worker {os.getpid()}] Validating shard {shard}: {len(reply['proxies'])} candidates.")
+            validating = threading.Event()
+
+            def heartbeat():
+                while not validating.wait(SHARD_LEASE_SECONDS / 3):
+                    send({"op": "heartbeat", "shard": shard})
+
+            heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
+            heartbeat_thread.start()
+            try:
+                results = validate_shard(reply["proxies"], reply["hints"])
+            finally:
+                validating.set()
+                heartbeat_thread.join()
+            send({"op": "result", "shard": shard, "results": results, "dnsbl": dnsbl_resolver.take_new_entries(),
+                  "stages": run_metrics.take_stages()})
+    finally:
+        stream.close()
+        connection.close()
+
+def run_coordinator(host=COORDINATOR_HOST, port=COORDINATOR_PORT, local_workers=0):
+    """Scrapes, shards the candidates out to workers, and writes the merged results like a normal run."""
+    global run_metrics
+    run_metrics = RunMetrics()
+    open_state()
+    try:
+        targets = source_stats.plan(SCRAPING_TARGETS) if SOURCE_ADAPTIVE_BUDGETS else SCRAPING_TARGETS
+        candidates, hints, tally = collect_candidates(targets)
+        coordinator = ShardCoordinator(candidates, hints)
+        asyncio.run(coordinator.run(host, port, local_workers))
+    finally:
+        dnsbl_resolver.save() # Holds the workers' lookups, merged from their shard results
+        close_state()
+    for entry in coordinator.working:
+        tally.credit_working(entry["proxy"])
+    source_stats.record_run(run_metrics.sites, tally, targets, SCRAPING_TARGETS)
+    source_stats.save()
+
+    working = [entry["proxy"] for entry in coordinator.working]
+    if working:
+        with open(OUTPUT_FILE + ".partial", "w") as f:
+            f.writelines(proxy + "\n" for proxy in working)
+        os.replace(OUTPUT_FILE + ".partial", OUTPUT_FILE)
+        write_ranked_proxies(coordinator.working)
+    run_metrics.set_gauge("working_proxies", len(working))
+    run_metrics.set_gauge("unique_candidates", len(candidates))
+    run_metrics.set_gauge("shards_reassigned", coordinator.reassigned)
+    run_metrics.write_json()
+    run_metrics.write_prometheus()
+    print(f"\nTested {coordinator.tested} candidates across {len(coordinator.shards)} shards "
+          f"({coordinator.reassigned} re-queued), found {len(working)} working and clean proxies.")
+    if working:
+        print(f"Working proxies saved to {OUTPUT_FILE}, ranked by latency score in {OUTPUT_JSON_FILE} and {OUTPUT_CSV_FILE}")
 
 if __name__ == "__main__":
-    process_scraped_proxies()
+    parser = argparse.ArgumentParser(description="Scrape free proxy lists, validate the proxies and save the working ones.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--daemon", action="store_true", help="keep a live proxy pool and serve it over a local HTTP API")
+    mode.add_argument("--coordinator", action="store_true", help="scrape, then hand validation shards out to workers and merge their results")
+    mode.add_argument("--worker", metavar="HOST:PORT", help="validate shards for the coordinator at HOST:PORT")
+    parser.add_argument("--local-workers", type=int, default=0, help="with --coordinator, also start this many workers on this machine")
+    parser.add_argument("--host", help=f"bind address for --daemon/--coordinator (default {DAEMON_HOST} / {COORDINATOR_HOST})")
+    parser.add_argument("--port", type=int, help=f"port for --daemon/--coordinator (default {DAEMON_PORT} / {COORDINATOR_PORT})")
+    args = parser.parse_args()
+    if args.daemon:
+        run_daemon(args.host or DAEMON_HOST, DAEMON_PORT if args.port is None else args.port)
+    elif args.coordinator:
+        run_coordinator(args.host or COORDINATOR_HOST, COORDINATOR_PORT if args.port is None else args.port, args.local_workers)
+    elif args.worker:
+        run_worker(args.worker)
+    else:
+        process_scraped_proxies()
@@ -0,0 +1,132 @@
+"""DnsblResolver against a stub UDP nameserver: listings, NXDOMAIN with SOA, timeouts and the saved cache."""
+
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import proxy_scraper # noqa: E402
+
+ZONES = ["a.test", "b.test"]
+
+class StubNameserver:
+    """Answers <reversed-ip>.<zone> queries from `answers[(ip, zone)]`: "listed", "servfail" or "silent"; anything else is NXDOMAIN."""
+
+    def __init__(self, answers, delay=0):
+        self.answers = answers
+        self.delay = delay
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        try:
+            while True:
+                data, client = self.sock.recvfrom(512)
+                offset, labels = 12, []
+                while data[offset]:
+                    labels.append(data[offset + 1:offset + 1 + data[offset]].decode("ascii"))
+                    offset += data[offset] + 1
+                ip, zone = ".".join(labels[:4][::-1]), ".".join(labels[4:])
+                self.queries.append((ip, zone))
+                response = self.response(data[:2], data[12:offset + 5], self.answers.get((ip, zone)))
+                if response is not None:
+                    time.sleep(self.delay)
+                    self.sock.sendto(response, client)
+        except OSError:
+            return # Socket closed at teardown
+
+    @staticmethod
+    def response(query_id, question, answer):
+        if answer == "silent":
+            return None
+        if answer == "servfail":
+            return query_id + struct.pack("!HHHHH", 0x8182, 1, 0, 0, 0) + question
+        if answer == "listed": # Answer name is a compression pointer back to the question
+            return (query_id + struct.pack("!HHHHH", 0x8180, 1, 1, 0, 0) + question
+                    + b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, 600, 4) + bytes([127, 0, 0, 2]))
+        # NXDOMAIN, SOA in the authority section; its MNAME/RNAME end in pointers too
+        soa = b"\x02ns\xc0\x0c\x05admin\xc0\x0c" + struct.pack("!IIIII", 1, 3600, 600, 86400, 120)
+        return (query_id + struct.pack("!HHHHH", 0x8183, 1, 0, 1, 0) + question
+                + b"\xc0\x0c" + struct.pack("!HHIH", 6, 1, 900, len(soa)) + soa)
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def stub(monkeypatch):
+    # TTLs as the server sent them, so the SOA negative TTL is visible in the cache
+    monkeypatch.setattr(proxy_scraper, "DNSBL_MIN_CACHE_TTL", 1)
+    monkeypatch.setattr(proxy_scraper, "DNSBL_MAX_CACHE_TTL", 10 ** 6)
+    servers = []
+
+    def start(answers, delay=0):
+        server = StubNameserver(answers, delay)
+        servers.append(server)
+        return server, proxy_scraper.DnsblResolver(zones=ZONES, nameserver=server.address, timeout=0.5)
+
+    yield start
+    for server in servers:
+        server.close()
+
+def test_listed_ip(stub):
+    server, resolver = stub({("1.2.3.4", "a.test"): "listed", ("1.2.3.4", "b.test"): "listed"})
+    assert resolver.check("1.2.3.4", stop_on_listing=False) == 2
+    expires_at = resolver.cache["1.2.3.4"][1]
+    assert 590 < expires_at - time.time() <= 600
+
+def test_stop_on_listing_ignores_silent_zones(stub):
+    server, resolver = stub({("1.2.3.4", "a.test"): "listed", ("1.2.3.4", "b.test"): "silent"})
+    started = time.monotonic()
+    assert resolver.check("1.2.3.4") == 1
+    assert time.monotonic() - started < 0.4 # Did not wait for b.test
+    assert resolver.cache["1.2.3.4"][0] == 1
+
+def test_nxdomain_uses_soa_negative_ttl(stub):
+    server, resolver = stub({})
+    assert resolver.check("5.6.7.8") == 0
+    listings, expires_at = resolver.cache["5.6.7.8"]
+    assert listings == 0
+    assert 110 < expires_at - time.time() <= 120 # min(record TTL 900, SOA minimum 120)
+
+@pytest.mark.parametrize("failure", ["silent", "servfail"])
+def test_unanswered_zone_is_not_cached(stub, failure):
+    server, resolver = stub({("9.9.9.9", "b.test"): failure})
+    assert resolver.check("9.9.9.9") == 0
+    assert "9.9.9.9" not in resolver.cache
+    assert resolver.check("9.9.9.9") == 0
+    assert resolver.misses == 2 and resolver.hits == 0
+
+def test_concurrent_checks_share_one_lookup(stub):
+    server, resolver = stub({("1.2.3.4", "a.test"): "listed"}, delay=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(resolver.check("1.2.3.4"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [1] * 5
+    assert resolver.misses == 1 and resolver.hits == 4
+    assert len(server.queries) == len(ZONES)
+
+def test_cache_round_trip(stub, tmp_path):
+    server, resolver = stub({("1.2.3.4", "a.test"): "listed"})
+    resolver.check("1.2.3.4")
+    resolver.check("5.6.7.8")
+    resolver.cache["2.2.2.2"] = (1, time.time() - 1) # Expired, must not be saved
+    path = str(tmp_path / "dnsbl_cache.json")
+    resolver.save(path)
+
+    loaded = proxy_scraper.DnsblResolver(zones=ZONES, nameserver=server.address, timeout=0.5)
+    assert loaded.load(path) == 2
+    assert loaded.cache == {ip: resolver.cache[ip] for ip in ("1.2.3.4", "5.6.7.8")}
+    queries = len(server.queries)
+    assert loaded.check("1.2.3.4") == 1 and loaded.check("5.6.7.8") == 0
+    assert len(server.queries) == queries and loaded.hits == 2